@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import namedtuple
+
+RAISED = "raised"
+ONGOING = "ongoing"
+CLEARED = "cleared"
+
+# reading is the sensor payload that caused the event; since is when the alarm was raised
+AlertEvent = namedtuple("AlertEvent", ["kind", "device_id", "reading", "time", "since"])
+
+
+class _DeviceState:
+    __slots__ = ("active", "streak", "raised_at", "notified_at")
+
+    def __init__(self):
+        self.active = False
+        self.streak = 0  # consecutive messages disagreeing with `active`
+        self.raised_at = None
+        self.notified_at = None
+
+
+class AlertEngine:
+    """Turns the per-message alarm flag of each device into alert events.
+
+    A device's alarm is raised after `raise_after` consecutive alarming
+    messages and cleared after `clear_after` consecutive quiet ones, so a
+    flickering sensor does not produce a raise/clear pair per message. While
+    an alarm stays up it is repeated every `renotify_interval` seconds.
+    Events are held for `digest_window` seconds after the first one so that
+    alarms from many devices at once can go out as a single digest.
+
+    observe() does a dict lookup and a few comparisons, whatever the number
+    of devices.
+    """
+
+    def __init__(self, raise_after=1, clear_after=3, renotify_interval=600, digest_window=2.0):
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.renotify_interval = renotify_interval
+        self.digest_window = digest_window
+        self._devices = {}
+        self._events = []
+        self._first_event_at = None
+        self._lock = threading.Lock()
+
+    def observe(self, device_id, alarm, reading=None, now=None):
+        """Feed one sensor message; returns the event it caused, if any"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceState()
+
+            event = None
+            if bool(alarm) != state.active:
+                state.streak += 1
+                if not state.active and state.streak >= self.raise_after:
+                    state.active, state.streak = True, 0
+                    state.raised_at = state.notified_at = now
+                    event = AlertEvent(RAISED, device_id, reading, now, now)
+                elif state.active and state.streak >= self.clear_after:
+                    state.active, state.streak = False, 0
+                    event = AlertEvent(CLEARED, device_id, reading, now, state.raised_at)
+            else:
+                state.streak = 0
+                if state.active and now - state.notified_at >= self.renotify_interval:
+                    state.notified_at = now
+                    event = AlertEvent(ONGOING, device_id, reading, now, state.raised_at)
+
+            if event is not None:
+                if not self._events:
+                    self._first_event_at = now
+                self._events.append(event)
+            return event
+
+    def due(self, now=None):
+        """Return and forget the held events once the digest window has passed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._events or now - self._first_event_at < self.digest_window:
+                return []
+            events, self._events = self._events, []
+            return events
+
+    def active(self):
+        """Device ids whose alarm is currently raised"""
+        with self._lock:
+            return [device_id for device_id, state in self._devices.items() if state.active]
+
+    def forget(self, device_id):
+        with self._lock:
+            self._devices.pop(device_id, None)
@@ -0,0 +1,20 @@
+"""time_server with its upstreams pointed at the stub in $STUB_URL, started
+as a separate process by bench_serving.py.
+
+    STUB_URL=http://127.0.0.1:8099 python benchmarks/bench_app.py            # dev server
+    STUB_URL=http://127.0.0.1:8099 gunicorn -c gunicorn.conf.py bench_app:app
+"""
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from loadtest import use_stub_upstreams
+
+app = use_stub_upstreams(os.environ["STUB_URL"]).app
+
+if __name__ == "__main__":
+    # the same call time_server.py makes when run directly
+    app.run(host="127.0.0.1", port=int(os.environ.get("PORT", 5000)), debug=False)
@@ -0,0 +1,75 @@
+"""Micro-benchmark of the calendar part of /time, before and after the per-day table.
+
+Run from Code/ForRemoteServer:  python benchmarks/bench_lunar.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lunarcalendar import Solar, Converter
+from solar_terms import SolarTermIndex, SOLAR_TERM_NAMES
+from lunar_table import LunarCalendar
+
+NUMBER = 20000
+
+
+def build_legacy_table(index, year):
+    """The hardcoded {"name", "date", "time"} list /time used to scan"""
+    table = []
+    for i, name in enumerate(SOLAR_TERM_NAMES):
+        start = datetime.fromtimestamp(index.term_start(year, i))
+        table.append({"name": name, "date": start.strftime("%Y-%m-%d"), "time": start.strftime("%H:%M")})
+    return table
+
+
+def legacy_lookup(table):
+    # the per-request work get_lunar_time() did before the lunar table
+    now = datetime.now()
+    solar_date = Solar(now.year, now.month, now.day)
+    weekday = now.strftime("%A")
+    lunar_date = Converter.Solar2Lunar(solar_date)
+    zodiac_en = ["Rat", "Ox", "Tiger", "Rabbit", "Dragon", "Snake",
+                 "Horse", "Goat", "Monkey", "Rooster", "Dog", "Pig"]
+    zodiac = zodiac_en[(lunar_date.year - 4) % 12]
+    current_term = None
+    for i in range(len(table)):
+        term = table[i]
+        term_start = datetime.strptime(f"{term['date']} {term['time']}", "%Y-%m-%d %H:%M")
+        if i < len(table) - 1:
+            next_term = table[i + 1]
+            term_end = datetime.strptime(f"{next_term['date']} {next_term['time']}", "%Y-%m-%d %H:%M")
+        else:
+            term_end = datetime(term_start.year + 1, 1, 1)
+        if term_start <= now < term_end:
+            current_term = i
+            break
+    return weekday, lunar_date, zodiac, current_term
+
+
+def table_lookup(calendar):
+    now = datetime.now()
+    day = calendar.day(now.date())
+    return day, calendar.solar_term_at(day, now.timestamp())
+
+
+def main():
+    year = datetime.now().year
+    index = SolarTermIndex(year - 1, year + 10)
+    calendar = LunarCalendar(index)
+    calendar.warm()
+    table = build_legacy_table(index, year)
+
+    before = timeit.timeit(lambda: legacy_lookup(table), number=NUMBER) / NUMBER
+    after = timeit.timeit(lambda: table_lookup(calendar), number=NUMBER) / NUMBER
+
+    print(f"per-request cost over {NUMBER} calls")
+    print(f"  before (convert + linear strptime scan): {before * 1e6:8.2f} us")
+    print(f"  after  (per-day table lookup):           {after * 1e6:8.2f} us")
+    print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compare the Flask development server (`python time_server.py`) with the
+gunicorn production mode (gunicorn.conf.py) under the same load.
+
+Each mode runs as its own process tree in a scratch directory, so it starts
+with an empty persistent cache, and talks to a fresh stub upstream so the
+upstream call counts can be compared too. With --reload the gunicorn master
+is sent SIGHUP halfway through the run to check that a graceful reload does
+not fail any requests.
+
+Run from Code/ForRemoteServer (gunicorn must be installed):
+    python benchmarks/bench_serving.py --concurrency 64 --duration 15 --latency 0.3
+"""
+import argparse
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from loadtest import print_report, run
+from stub_upstreams import StubConfig, start_stub
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/time")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+def start_server(mode, stub_url, port, workdir):
+    env = dict(os.environ, STUB_URL=stub_url, PORT=str(port),
+               PYTHONPATH=os.pathsep.join([HERE, ROOT, os.environ.get("PYTHONPATH", "")]))
+    if mode == "dev":
+        command = [sys.executable, os.path.join(HERE, "bench_app.py")]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+                   "--bind", f"127.0.0.1:{port}", "bench_app:app"]
+    return subprocess.Popen(command, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def bench(mode, args):
+    stub_config = StubConfig(args.latency, args.jitter)
+    stub_server, stub_url = start_stub(stub_config)
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(mode, stub_url, port, workdir)
+        try:
+            wait_until_up(port)
+            if mode == "gunicorn" and args.reload:
+                timer = threading.Timer(args.duration / 2, process.send_signal, (signal.SIGHUP,))
+                timer.start()
+            report = run(argparse.Namespace(
+                target=f"http://127.0.0.1:{port}", endpoints=args.endpoints,
+                concurrency=args.concurrency, duration=args.duration, ips=args.ips,
+                latency=args.latency, jitter=args.jitter, failure_rate=0.0, hang_rate=0.0, hang_time=0.0))
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+            stub_server.shutdown()
+    report["target"] = mode
+    report["upstream_calls"] = dict(stub_config.calls)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dev server vs gunicorn for time_server")
+    parser.add_argument("--endpoints", nargs="+", default=["/time", "/weather", "/calendar"])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--ips", type=int, default=200, help="distinct client IPs to simulate")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--reload", action="store_true", help="SIGHUP gunicorn halfway through its run")
+    args = parser.parse_args()
+
+    dev = bench("dev", args)
+    print("== app.run (development server)")
+    print_report(dev)
+    print("== gunicorn (gunicorn.conf.py)")
+    print_report(bench("gunicorn", args), dev)
+
+
+if __name__ == "__main__":
+    main()
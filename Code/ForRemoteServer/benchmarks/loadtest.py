@@ -0,0 +1,212 @@
+"""Offline load test for time_server.
+
+Starts time_server.app in-process against the local stub upstreams (or
+drives an already running server with --target), hammers the chosen
+endpoints from many concurrent clients and reports requests/sec and
+p50/p95/p99 latency per endpoint. Results are written as JSON so runs can
+be compared with --compare. No network access or API quota is needed.
+
+Run from Code/ForRemoteServer:
+    python benchmarks/loadtest.py --concurrency 32 --duration 10 --output run.json
+    python benchmarks/loadtest.py --latency 0.3 --failure-rate 0.1 --compare run.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from stub_upstreams import StubConfig, start_stub
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, status in samples)
+    errors = sum(1 for latency, status in samples if status >= 500 or status == 0)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def use_stub_upstreams(stub_url):
+    """Import time_server and point its upstream clients at the stub"""
+    # the stub accepts any key; this keeps time_server from needing real ones
+    os.environ.setdefault("IPGEO_API_KEY", "stub")
+    os.environ.setdefault("GOOGLE_WEATHER_API_KEY", "stub")
+    import time_server
+    from upstream import build_clients
+
+    for options in time_server.UPSTREAMS.values():
+        options["base_url"] = stub_url
+    time_server.upstreams.update(build_clients(time_server.UPSTREAMS))
+    return time_server
+
+
+def start_local_server(stub_url, host="127.0.0.1"):
+    """Serve time_server against the stub on a free port"""
+    from werkzeug.serving import make_server
+
+    # keep the caches in memory so every run starts cold, whatever ran before
+    # in this directory; bench_serving.py runs each server in a scratch directory
+    os.environ.setdefault("TIME_SERVER_CACHE_PATH", "")
+    time_server = use_stub_upstreams(stub_url)
+    server = make_server(host, 0, time_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def fetch(conn, endpoint, headers):
+    conn.request("GET", endpoint, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def worker(target, endpoints, ips, deadline, results, lock):
+    url = urlparse(target)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    local = {endpoint: [] for endpoint in endpoints}
+    i = random.randrange(len(endpoints))
+    while time.perf_counter() < deadline:
+        endpoint = endpoints[i % len(endpoints)]
+        i += 1
+        # each simulated device sits behind one of `ips` NAT addresses
+        device = random.randrange(ips)
+        headers = {"X-Forwarded-For": f"10.0.{device // 256}.{device % 256}"}
+        start = time.perf_counter()
+        try:
+            try:
+                status = fetch(conn, endpoint, headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the server closed the kept-alive connection (e.g. a worker
+                # restarting); retry once on a new one like HTTP clients do
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+                status = fetch(conn, endpoint, headers)
+        except (OSError, http.client.HTTPException):
+            status = 0
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        local[endpoint].append((time.perf_counter() - start, status))
+    conn.close()
+    with lock:
+        for endpoint, samples in local.items():
+            results[endpoint].extend(samples)
+
+
+def run(args):
+    stub_config = StubConfig(args.latency, args.jitter, args.failure_rate, args.hang_rate, args.hang_time)
+    stub_server = None
+    server = None
+    if args.target:
+        target = args.target
+    else:
+        stub_server, stub_url = start_stub(stub_config)
+        server, target = start_local_server(stub_url)
+
+    results = {endpoint: [] for endpoint in args.endpoints}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(target, args.endpoints, args.ips, deadline, results, lock))
+        for _ in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if server is not None:
+        server.shutdown()
+    if stub_server is not None:
+        stub_server.shutdown()
+
+    all_samples = [sample for samples in results.values() for sample in samples]
+    return {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "target": args.target or "in-process",
+        "config": {
+            "endpoints": args.endpoints,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "ips": args.ips,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+            "hang_rate": args.hang_rate,
+        },
+        "upstream_calls": dict(stub_config.calls) if not args.target else None,
+        "endpoints": {endpoint: summarize(samples, elapsed) for endpoint, samples in results.items()},
+        "total": summarize(all_samples, elapsed),
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = dict(report["endpoints"], total=report["total"])
+    for name, row in rows.items():
+        print(f"{name:<28}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+        if baseline:
+            old = baseline["endpoints"].get(name) if name != "total" else baseline.get("total")
+            if old:
+                print(f"{'  vs baseline':<28}{'':>10}{'':>8}{row['rps'] - old['rps']:>+10.1f}"
+                      f"{row['p50_ms'] - old['p50_ms']:>+10.2f}{row['p95_ms'] - old['p95_ms']:>+10.2f}"
+                      f"{row['p99_ms'] - old['p99_ms']:>+10.2f}")
+    if report["upstream_calls"] is not None:
+        print(f"upstream calls: {report['upstream_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for time_server")
+    parser.add_argument("--endpoints", nargs="+", default=["/time", "/weather"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--ips", type=int, default=20, help="distinct client IPs to simulate")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of stub answers that are 503")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of stub answers that stall")
+    parser.add_argument("--hang-time", type=float, default=30.0)
+    parser.add_argument("--target", help="benchmark a running server instead, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Replay recorded sensor messages through the fire detector.
+
+Input is JSON lines, one sensor message per line as published on the sensor
+topic plus a "time" field (Unix seconds), e.g.
+    {"time": 1760000000.5, "device_id": "kitchen", "temperature": 24.1, "smoke": 3, "alarm": false}
+
+Messages are fed to FireDetector in time order and evaluated every
+--interval simulated seconds, at --speed times real time (0 = as fast as
+possible). Every raise/clear is printed, and at the end each device's first
+detection is compared with the first message in which the device itself
+reported alarm, which is how far ahead of the device threshold we are.
+
+With --db the messages are read from the SQLite file tg_server appends every
+reading to (SENSOR_DB_PATH), optionally limited with --device/--since/--until.
+
+With --synthetic N a log of N quiet devices plus one slow and one fast fire
+is generated instead, handy for trying out thresholds:
+    python benchmarks/replay_sensors.py --synthetic 50
+    python benchmarks/replay_sensors.py sensors.jsonl --temp-rate-raise 6 --speed 100
+    python benchmarks/replay_sensors.py --db sensor_readings.db --since 1760000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from fire_detector import FireDetector
+from sensor_history import to_number
+from sensor_store import SensorStore
+
+
+def read_log(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_store(path, device_id=None, since=None, until=None):
+    store = SensorStore(path)
+    try:
+        for reading in store.query(device_id, since, until):
+            message = json.loads(reading.payload)
+            message["time"] = reading.time
+            yield message
+    finally:
+        store.close()
+
+
+def synthetic_log(devices, duration=1800, period=5.0, start=1_700_000_000):
+    """Quiet devices with sensor noise, plus 'slow-fire' (0.5 ℃/min for the
+    first 10 minutes, then 12 ℃/min) and 'fast-fire' (20 ℃/min) starting
+    halfway through. Devices report alarm above 57 ℃ or 30% smoke."""
+    messages = []
+    fire_at = start + duration / 2
+    names = [f"device-{i}" for i in range(devices)] + ["slow-fire", "fast-fire"]
+    for name in names:
+        t = start + random.uniform(0, period)
+        while t < start + duration:
+            temperature = 22 + random.gauss(0, 0.3)
+            smoke = max(0.0, 2 + random.gauss(0, 0.5))
+            minutes = (t - fire_at) / 60
+            if name == "slow-fire" and minutes > 0:
+                temperature += 0.5 * min(minutes, 10) + 12 * max(0.0, minutes - 10)
+                smoke += 1.5 * minutes
+            elif name == "fast-fire" and minutes > 0:
+                temperature += 20 * minutes
+                smoke += 8 * minutes
+            messages.append({
+                "time": t, "device_id": name, "temperature": round(temperature, 1),
+                "smoke": round(min(smoke, 100.0), 1), "alarm": temperature > 57 or smoke > 30,
+            })
+            t += period
+    messages.sort(key=lambda message: message["time"])
+    return messages
+
+
+def replay(messages, detector, interval=1.0, speed=0.0, quiet=False):
+    """Feed messages through the detector; returns (detections, device_alarms, count, wall seconds)"""
+    first_detection = {}
+    first_device_alarm = {}
+    next_eval = None
+    wall_start = time.perf_counter()
+    sim_start = None
+    count = 0
+
+    def run_evaluation(at):
+        for detection in detector.evaluate():
+            if detection.flagged:
+                first_detection.setdefault(detection.device_id, at)
+            if not quiet:
+                print(f"{at - sim_start:9.1f}s  {'RAISE' if detection.flagged else 'clear'}  "
+                      f"{detection.device_id:<16} {detection.temperature:6.1f}℃ "
+                      f"{detection.temperature_rate:+6.1f}℃/min  {detection.smoke:5.1f}% "
+                      f"{detection.smoke_rate:+6.1f}%/min")
+
+    for message in messages:
+        t = float(message["time"])
+        if sim_start is None:
+            sim_start = next_eval = t
+        while t >= next_eval:
+            run_evaluation(next_eval)
+            next_eval += interval
+        if speed:
+            delay = (t - sim_start) / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        detector.ingest(message.get("device_id", "unknown"), t,
+                        to_number(message.get("temperature")), to_number(message.get("smoke")))
+        if message.get("alarm"):
+            first_device_alarm.setdefault(message.get("device_id", "unknown"), t)
+        count += 1
+    if next_eval is not None:
+        run_evaluation(next_eval)
+    return first_detection, first_device_alarm, count, time.perf_counter() - wall_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sensor logs through the fire detector")
+    parser.add_argument("log", nargs="?", help="JSON lines file of sensor messages")
+    parser.add_argument("--db", help="read messages from a tg_server sensor store instead")
+    parser.add_argument("--device", help="with --db, only this device")
+    parser.add_argument("--since", type=float, help="with --db, Unix time to start from")
+    parser.add_argument("--until", type=float, help="with --db, Unix time to stop at")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="generate a log with N quiet devices")
+    parser.add_argument("--speed", type=float, default=0.0, help="times real time, 0 = unthrottled")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between evaluation passes")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    defaults = FireDetector()
+    for name in ("smoothing", "rate_smoothing", "temp_rate_raise", "temp_rate_clear", "temp_raise",
+                 "temp_clear", "smoke_rate_raise", "smoke_rate_clear"):
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=getattr(defaults, name))
+    parser.add_argument("--min-samples", type=int, default=defaults.min_samples)
+    args = parser.parse_args()
+    if not args.log and not args.db and args.synthetic is None:
+        parser.error("give a log file, --db PATH or --synthetic N")
+
+    if args.synthetic is not None:
+        messages = synthetic_log(args.synthetic)
+    elif args.db:
+        messages = list(read_store(args.db, args.device, args.since, args.until))
+    else:
+        messages = list(read_log(args.log))
+    messages.sort(key=lambda message: float(message["time"]))
+    detector = FireDetector(
+        smoothing=args.smoothing, rate_smoothing=args.rate_smoothing, min_samples=args.min_samples,
+        temp_rate_raise=args.temp_rate_raise, temp_rate_clear=args.temp_rate_clear,
+        temp_raise=args.temp_raise, temp_clear=args.temp_clear,
+        smoke_rate_raise=args.smoke_rate_raise, smoke_rate_clear=args.smoke_rate_clear)
+
+    detections, device_alarms, count, wall = replay(messages, detector, args.interval, args.speed, args.quiet)
+    if not messages:
+        print("log is empty")
+        return
+    simulated = float(messages[-1]["time"]) - float(messages[0]["time"])
+    print(f"\n{count} messages, {simulated:.0f}s of data replayed in {wall:.2f}s "
+          f"({simulated / wall if wall else float('inf'):.0f}x real time)")
+    print(f"{'device':<16}{'detector':>12}{'device alarm':>14}{'lead':>10}")
+    for device_id in sorted(set(detections) | set(device_alarms)):
+        detected = detections.get(device_id)
+        alarmed = device_alarms.get(device_id)
+        lead = f"{alarmed - detected:+.0f}s" if detected and alarmed else "-"
+        print(f"{device_id:<16}{detected - messages[0]['time'] if detected else float('nan'):>11.0f}s"
+              f"{alarmed - messages[0]['time'] if alarmed else float('nan'):>13.0f}s{lead:>10}")
+    false_alarms = sorted(set(detections) - set(device_alarms))
+    if false_alarms:
+        print(f"flagged without a device alarm: {', '.join(false_alarms)}")
+
+
+if __name__ == "__main__":
+    main()
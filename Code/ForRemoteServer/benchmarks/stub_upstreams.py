@@ -0,0 +1,134 @@
+"""Local stand-ins for ipgeolocation.io and the Google Weather API.
+
+Both answer on one port: /ipgeo returns a fixed location per client IP and
+/v1/forecast/days:lookup returns a 5-day forecast in the Google format.
+Latency and failures can be injected to see how time_server copes.
+
+Run standalone:  python benchmarks/stub_upstreams.py --port 8099 --latency 0.2
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CONDITIONS = ["CLEAR", "PARTLY_CLOUDY", "RAIN", "LIGHT_SNOW", "THUNDERSTORM"]
+
+
+class StubConfig:
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, hang_rate=0.0, hang_time=30.0):
+        self.latency = latency            # seconds added to every answer
+        self.jitter = jitter              # +/- uniform random seconds on top of latency
+        self.failure_rate = failure_rate  # fraction of requests answered with HTTP 503
+        self.hang_rate = hang_rate        # fraction of requests that stall for hang_time
+        self.hang_time = hang_time
+        self.calls = {"geo": 0, "forecast": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+
+def geo_payload(ip):
+    # spread client IPs over a handful of cities so the forecast grid matters
+    city = sum(ip.encode()) % 8
+    return {
+        "ip": ip,
+        "latitude": f"{30 + city * 0.7:.4f}",
+        "longitude": f"{120 + city * 0.9:.4f}",
+        "city": f"City{city}",
+        "district": f"District{city}",
+    }
+
+
+def forecast_payload():
+    now = time.localtime()
+    days = []
+    for i in range(5):
+        day = time.localtime(time.time() + i * 86400)
+        days.append({
+            "displayDate": {"year": day.tm_year, "month": day.tm_mon, "day": day.tm_mday},
+            "maxTemperature": {"degrees": 20.5 + i},
+            "minTemperature": {"degrees": 10.2 + i},
+            "daytimeForecast": {
+                "precipitation": {"probability": {"percent": (now.tm_mday * 7 + i * 13) % 100}},
+                "weatherCondition": {
+                    "type": CONDITIONS[i % len(CONDITIONS)],
+                    "description": {"text": CONDITIONS[i % len(CONDITIONS)].replace("_", " ").title()},
+                },
+            },
+        })
+    return {"forecastDays": days}
+
+
+def make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/ipgeo":
+                config.count("geo")
+                body = geo_payload(parse_qs(url.query).get("ip", ["0.0.0.0"])[0])
+            elif url.path == "/v1/forecast/days:lookup":
+                config.count("forecast")
+                body = forecast_payload()
+            else:
+                return self._send(404, {"error": "not found"})
+
+            delay = config.latency + random.uniform(-config.jitter, config.jitter)
+            if config.hang_rate and random.random() < config.hang_rate:
+                delay = config.hang_time
+            if delay > 0:
+                time.sleep(delay)
+            if config.failure_rate and random.random() < config.failure_rate:
+                return self._send(503, {"error": "injected failure"})
+            self._send(200, body)
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return StubHandler
+
+
+def start_stub(config, host="127.0.0.1", port=0):
+    """Start the stub server on a background thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.failure_rate, args.hang_rate)
+    server, base_url = start_stub(config, args.host, args.port)
+    print(f"Stub upstreams listening on {base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
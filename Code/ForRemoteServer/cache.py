@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _monotonic_from_wall(timestamp):
+    """Convert a time.time() timestamp read back from the store to the monotonic clock"""
+    return time.monotonic() - (time.time() - timestamp)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live.
+
+    With a PersistentStore, misses are read through from the store and every
+    set() is written behind to it, so entries survive a restart and are
+    shared with other processes using the same file.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, negative_ttl=300, store=None, namespace=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.store = store
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing/expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            # expired entries stay until evicted so get_stale() can fall back on them
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        value = self._load_stored(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def _load_stored(self, key):
+        if self.store is None:
+            return None
+        row = self.store.get(self.namespace, key)
+        if row is None:
+            return None
+        value, stored_at, expires_at = row
+        expires_at = _monotonic_from_wall(expires_at if expires_at is not None else stored_at + self.ttl)
+        self._insert(key, expires_at, value)
+        return value
+
+    def get_stale(self, key, default=None):
+        """Return the value for key even if it has expired, without touching the counters"""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entry when full"""
+        ttl = self.ttl if ttl is None else ttl
+        self._insert(key, time.monotonic() + ttl, value)
+        if self.store is not None:
+            self.store.put(self.namespace, key, value, ttl=ttl)
+
+    def _insert(self, key, expires_at, value):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set_negative(self, key, value):
+        """Cache a failed lookup for the (shorter) negative TTL"""
+        self.set(key, value, ttl=self.negative_ttl)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+class StaleWhileRevalidateCache:
+    """LRU cache that keeps serving entries past a soft TTL while one
+    background thread refreshes them, until they reach max_age.
+
+    With a PersistentStore, entries are read through and written behind like
+    TTLCache; they stay on disk for persist_ttl (default max_age) so callers
+    can still fall back on them with get(max_age=...).
+    """
+
+    def __init__(self, maxsize=512, soft_ttl=1800, max_age=3 * 3600, store=None, namespace=None,
+                 persist_ttl=None):
+        self.maxsize = maxsize
+        self.soft_ttl = soft_ttl
+        self.max_age = max_age
+        self.store = store
+        self.namespace = namespace
+        self.persist_ttl = max_age if persist_ttl is None else persist_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """Return the value for key, calling loader() on a miss.
+
+        Entries older than soft_ttl are returned as-is and refreshed in the
+        background; entries older than max_age are treated as missing.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None:
+            entry = self._load_stored(key)
+        with self._lock:
+            if entry is not None and now - entry[0] < self.max_age:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                if now - entry[0] >= self.soft_ttl:
+                    self.stale_hits += 1
+                    self._start_refresh(key, loader)
+                else:
+                    self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def get(self, key, default=None, max_age=None):
+        """Return the value for key without loading; max_age overrides the hard expiry"""
+        limit = self.max_age if max_age is None else max_age
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None:
+            entry = self._load_stored(key)
+        if entry is None or time.monotonic() - entry[0] >= limit:
+            return default
+        return entry[1]
+
+    def age(self, key):
+        """Seconds since the entry for key was stored, or None if there is none.
+
+        With a store, a newer row written by another process counts too.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+        if self.store is not None:
+            row = self.store.get(self.namespace, key)
+            if row is not None and (entry is None or _monotonic_from_wall(row[1]) > entry[0]):
+                entry = (_monotonic_from_wall(row[1]), row[0])
+                self._insert(key, entry)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def set(self, key, value):
+        self._insert(key, (time.monotonic(), value))
+        if self.store is not None:
+            self.store.put(self.namespace, key, value, ttl=self.persist_ttl)
+
+    def _insert(self, key, entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _load_stored(self, key):
+        """Pull key from the store into memory, keeping its original age"""
+        if self.store is None:
+            return None
+        row = self.store.get(self.namespace, key)
+        if row is None:
+            return None
+        value, stored_at, _ = row
+        entry = (_monotonic_from_wall(stored_at), value)
+        self._insert(key, entry)
+        return entry
+
+    def _start_refresh(self, key, loader):
+        # caller holds the lock
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        thread = threading.Thread(target=self._refresh, args=(key, loader), daemon=True)
+        thread.start()
+
+    def _refresh(self, key, loader):
+        try:
+            # another process sharing the store may already have refreshed it
+            if self.store is not None:
+                row = self.store.get(self.namespace, key)
+                if row is not None and time.time() - row[1] < self.soft_ttl:
+                    self._insert(key, (_monotonic_from_wall(row[1]), row[0]))
+                    return
+            value = loader()
+            self.set(key, value)
+            self.refreshes += 1
+        except Exception as e:
+            # keep serving the stale entry until it reaches max_age
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "hit_ratio": (self.hits + self.stale_hits) / total if total else 0.0,
+            }
@@ -0,0 +1,171 @@
+"""Compact binary encoding of the /time and /weather payloads.
+
+Served instead of JSON when a device asks for it with ``?fmt=bin`` or
+``Accept: application/vnd.thatclock+bin``. All integers are little-endian
+(native on the ESP32), strings are UTF-8 prefixed with a u8 byte length.
+
+Header (4 bytes), shared by every record::
+
+    char[2]  magic        b"TC"
+    u8       version      1
+    u8       kind         1 = time, 2 = weather, 3 = snapshot
+
+Time record (kind 1, 19 bytes with header)::
+
+    u16 year   u8 month   u8 day   u8 hour   u8 minute   u8 second
+    u8  weekday      0 = Sunday, as in struct tm
+    u8  solar_term   0-23, 0 = Minor Cold
+    u16 lunar_year   u8 lunar_month   u8 lunar_day
+    u8  lunar_leap   0/1
+    u8  zodiac       0-11, 0 = Rat
+
+Weather record (kind 2)::
+
+    str location
+    str district
+    u8  day_count
+    day_count x {
+        u16 year   u8 month   u8 day
+        i16 temperature_max   tenths of a degree C
+        i16 temperature_min   tenths of a degree C
+        u8  precipitation     percent
+        u8  weather_type      icon id from weather_image_mapping
+        str descriptions
+    }
+
+Snapshot record (kind 3)::
+
+    u8  flags         bit 0: weather is stale, bit 1: weather is missing
+    time record       complete, with its own header
+    weather record    complete, with its own header; absent if bit 1 is set
+"""
+import struct
+
+MIMETYPE = "application/vnd.thatclock+bin"
+MAGIC = b"TC"
+VERSION = 1
+KIND_TIME = 1
+KIND_WEATHER = 2
+KIND_SNAPSHOT = 3
+
+FLAG_STALE = 0x01
+FLAG_NO_WEATHER = 0x02
+
+_HEADER = struct.Struct("<2sBB")
+_TIME = struct.Struct("<HBBBBBBBHBBBB")
+_DAY = struct.Struct("<HBBhhBB")
+_COUNT = struct.Struct("<B")
+
+
+def _pack_str(text):
+    data = (text or "").encode("utf-8")
+    if len(data) > 255:
+        # cut on a character boundary
+        data = data[:255].decode("utf-8", errors="ignore").encode("utf-8")
+    return _COUNT.pack(len(data)) + data
+
+
+def _unpack_str(buf, offset):
+    (length,) = _COUNT.unpack_from(buf, offset)
+    offset += 1
+    return buf[offset:offset + length].decode("utf-8", errors="replace"), offset + length
+
+
+def _tenths(degrees):
+    return int(round(float(degrees) * 10))
+
+
+def encode_time(now, day, solar_term):
+    """Pack the current time, its lunar_table.CalendarDay and solar term into a time record"""
+    return _HEADER.pack(MAGIC, VERSION, KIND_TIME) + _TIME.pack(
+        day.year, day.month, day.day, now.hour, now.minute, now.second,
+        now.isoweekday() % 7, solar_term,
+        day.lunar_year, day.lunar_month, day.lunar_day,
+        int(day.lunar_leap), (day.lunar_year - 4) % 12,
+    )
+
+
+def encode_weather(payload):
+    """Pack a /weather payload (location, district, forecast list) into a weather record"""
+    forecast = payload["forecast"]
+    parts = [
+        _HEADER.pack(MAGIC, VERSION, KIND_WEATHER),
+        _pack_str(payload.get("location")),
+        _pack_str(payload.get("district")),
+        _COUNT.pack(len(forecast)),
+    ]
+    for day in forecast:
+        parts.append(_DAY.pack(
+            day["year"], day["month"], day["day"],
+            _tenths(day["temperature_max"]), _tenths(day["temperature_min"]),
+            int(day["precipitation"]), day["weather_type"],
+        ))
+        parts.append(_pack_str(day["descriptions"]))
+    return b"".join(parts)
+
+
+def encode_snapshot(time_record, weather_record, stale=False):
+    """Wrap an encoded time record and an encoded weather record (or None) in a snapshot"""
+    flags = (FLAG_STALE if stale else 0) | (FLAG_NO_WEATHER if weather_record is None else 0)
+    return (_HEADER.pack(MAGIC, VERSION, KIND_SNAPSHOT) + _COUNT.pack(flags)
+            + time_record + (weather_record or b""))
+
+
+def decode(buf):
+    """Decode a record back into a dict (used for testing)"""
+    record, _ = _decode_from(buf, 0)
+    return record
+
+
+def _decode_from(buf, offset):
+    magic, version, kind = _HEADER.unpack_from(buf, offset)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported record header {magic!r} v{version}")
+    offset += _HEADER.size
+
+    if kind == KIND_TIME:
+        (year, month, day, hour, minute, second, weekday, solar_term,
+         lunar_year, lunar_month, lunar_day, lunar_leap, zodiac) = _TIME.unpack_from(buf, offset)
+        offset += _TIME.size
+        return {
+            "kind": "time",
+            "year": year, "month": month, "day": day,
+            "hour": hour, "minute": minute, "second": second,
+            "weekday": weekday, "solar_term": solar_term,
+            "lunar_year": lunar_year, "lunar_month": lunar_month, "lunar_day": lunar_day,
+            "lunar_leap": bool(lunar_leap), "zodiac": zodiac,
+        }, offset
+
+    if kind == KIND_WEATHER:
+        location, offset = _unpack_str(buf, offset)
+        district, offset = _unpack_str(buf, offset)
+        (count,) = _COUNT.unpack_from(buf, offset)
+        offset += 1
+        forecast = []
+        for _ in range(count):
+            (year, month, day, t_max, t_min,
+             precipitation, weather_type) = _DAY.unpack_from(buf, offset)
+            offset += _DAY.size
+            descriptions, offset = _unpack_str(buf, offset)
+            forecast.append({
+                "year": year, "month": month, "day": day,
+                "temperature_max": t_max / 10, "temperature_min": t_min / 10,
+                "precipitation": precipitation, "weather_type": weather_type,
+                "descriptions": descriptions,
+            })
+        return {"kind": "weather", "location": location, "district": district, "forecast": forecast}, offset
+
+    if kind == KIND_SNAPSHOT:
+        (flags,) = _COUNT.unpack_from(buf, offset)
+        time_record, offset = _decode_from(buf, offset + 1)
+        weather = None
+        if not flags & FLAG_NO_WEATHER:
+            weather, offset = _decode_from(buf, offset)
+        return {
+            "kind": "snapshot",
+            "time": time_record,
+            "weather": weather,
+            "weather_stale": bool(flags & FLAG_STALE),
+        }, offset
+
+    raise ValueError(f"Unknown record kind {kind}")
@@ -0,0 +1,123 @@
+import heapq
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+# field a device copies from the command into its sensor message to answer it
+REPLY_FIELD = "request_id"
+
+
+class _Request:
+    __slots__ = ("request_id", "command", "sent_at", "deadline", "future")
+
+    def __init__(self, request_id, command, sent_at, deadline):
+        self.request_id = request_id
+        self.command = command
+        self.sent_at = sent_at
+        self.deadline = deadline
+        self.future = Future()
+
+
+class RequestTracker:
+    """Control commands waiting for their reply on the sensor topic.
+
+    open() hands out a correlation id and a Future. The sensor message that
+    carries the id back in REPLY_FIELD resolves the Future with
+    (round-trip seconds, message). With accept_untagged, a message without
+    the field answers the oldest open request instead, for firmware that
+    does not echo ids; that is only the next message seen after open(), not
+    a round trip, so callers should open such requests once the command has
+    been delivered. Any number of requests can be open at once; one
+    timer thread fails those not answered within their timeout with
+    TimeoutError.
+
+    Futures are completed outside the lock, on whichever thread resolved or
+    expired them, so done-callbacks must not block.
+    """
+
+    def __init__(self, timeout=5.0, max_pending=1000, accept_untagged=False):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.accept_untagged = accept_untagged
+        self.completed = 0
+        self.timeouts = 0
+        self._pending = {}  # request_id -> _Request, in the order they were opened
+        self._deadlines = []  # heap of (deadline, request_id)
+        self._rtts = deque(maxlen=200)
+        self._cond = threading.Condition()
+        self._timer = threading.Thread(target=self._expire_loop, name="control-requests", daemon=True)
+        self._timer.start()
+
+    def open(self, command, timeout=None):
+        """Register a request; returns (request_id, Future)"""
+        now = time.monotonic()
+        request = _Request(uuid.uuid4().hex[:12], command, now, now + (timeout or self.timeout))
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                request.future.set_exception(RuntimeError("too many control requests in flight"))
+                return request.request_id, request.future
+            self._pending[request.request_id] = request
+            heapq.heappush(self._deadlines, (request.deadline, request.request_id))
+            self._cond.notify()
+        return request.request_id, request.future
+
+    def resolve(self, message, now=None):
+        """Complete the request a sensor message answers; returns True if it answered one"""
+        if not self._pending:
+            return False
+        now = time.monotonic() if now is None else now
+        request_id = message.get(REPLY_FIELD)
+        with self._cond:
+            if request_id is not None:
+                request = self._pending.pop(str(request_id), None)
+            elif self.accept_untagged and self._pending:
+                request = self._pending.pop(next(iter(self._pending)))
+            else:
+                request = None
+            if request is None:
+                return False
+            rtt = now - request.sent_at
+            self.completed += 1
+            self._rtts.append(rtt)
+        if not request.future.done():
+            request.future.set_result((rtt, message))
+        return True
+
+    def cancel(self, request_id, error=None):
+        """Stop waiting for a request, e.g. when its command could not be sent"""
+        with self._cond:
+            request = self._pending.pop(request_id, None)
+        if request is not None and not request.future.done():
+            request.future.set_exception(error or RuntimeError(f"{request.command} cancelled"))
+
+    def _expire_loop(self):
+        while True:
+            expired = []
+            with self._cond:
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, request_id = heapq.heappop(self._deadlines)
+                    request = self._pending.pop(request_id, None)
+                    if request is not None:
+                        expired.append(request)
+                self.timeouts += len(expired)
+                if not expired:
+                    # sleep until the next deadline, or until open() adds an earlier one
+                    self._cond.wait(self._deadlines[0][0] - now if self._deadlines else None)
+            for request in expired:
+                if not request.future.done():
+                    request.future.set_exception(
+                        TimeoutError(f"no reply to {request.command} within {request.deadline - request.sent_at:g}s"))
+
+    def stats(self):
+        with self._cond:
+            rtts = sorted(self._rtts)
+            return {
+                "pending": len(self._pending),
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "rtt_p50": rtts[len(rtts) // 2] if rtts else 0.0,
+                "rtt_p95": rtts[int(len(rtts) * 0.95)] if rtts else 0.0,
+            }
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class DeviceRecord:
+    """Latest state of one device. Records are never modified once stored,
+    an update replaces the record, so a reader always sees one message's worth
+    of consistent fields."""
+
+    __slots__ = ("device_id", "temperature", "smoke", "alarm", "first_seen", "last_seen", "messages")
+
+    def __init__(self, device_id, temperature, smoke, alarm, first_seen, last_seen, messages):
+        self.device_id = device_id
+        self.temperature = temperature
+        self.smoke = smoke
+        self.alarm = alarm
+        self.first_seen = first_seen
+        self.last_seen = last_seen  # time.time()
+        self.messages = messages
+
+
+class DeviceRegistry:
+    """Devices seen on the sensor topic, indexed by device id.
+
+    One writer (the MQTT thread) calls update(); readers use get() or
+    snapshot(), which never hold the lock for longer than a dict copy and
+    reuse the previous snapshot until something changed (see `version`). Devices silent for
+    `ttl` seconds are evicted, oldest first, and at most `max_devices` are kept.
+
+    Alarming devices are tracked in a set and records are kept in last-seen
+    order, so alarming() and silent() cost the size of their result, not of
+    the fleet.
+    """
+
+    def __init__(self, ttl=24 * 3600, max_devices=10000, on_evict=None):
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self.on_evict = on_evict  # on_evict(device_id), e.g. to drop per-device state elsewhere
+        self.evicted = 0
+        self._records = OrderedDict()  # device_id -> DeviceRecord, least recently seen first
+        self._alarming = set()
+        self._version = 0
+        self._snapshot = ((), -1)
+        self._lock = threading.Lock()
+
+    def update(self, device_id, temperature=None, smoke=None, alarm=False, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            old = self._records.get(device_id)
+            record = DeviceRecord(
+                device_id, temperature, smoke, bool(alarm),
+                old.first_seen if old is not None else now, now,
+                old.messages + 1 if old is not None else 1)
+            self._records[device_id] = record
+            self._records.move_to_end(device_id)
+            if record.alarm:
+                self._alarming.add(device_id)
+            else:
+                self._alarming.discard(device_id)
+            evicted = self._evict(now)
+            # a repeat of the same reading within the same minute changes nothing a list shows
+            if (evicted or old is None or old.temperature != record.temperature
+                    or old.smoke != record.smoke or old.alarm != record.alarm
+                    or old.last_seen // 60 != now // 60):
+                self._version += 1
+        for evicted_id in evicted:
+            if self.on_evict is not None:
+                self.on_evict(evicted_id)
+        return record
+
+    def _evict(self, now):
+        # caller holds the lock; the front of the OrderedDict is the longest silent device
+        evicted = []
+        while self._records:
+            device_id, record = next(iter(self._records.items()))
+            if now - record.last_seen <= self.ttl and len(self._records) <= self.max_devices:
+                break
+            del self._records[device_id]
+            self._alarming.discard(device_id)
+            evicted.append(device_id)
+        if evicted:
+            self.evicted += len(evicted)
+        return evicted
+
+    def evict_expired(self, now=None):
+        """Drop silent devices even when no messages arrive to trigger it"""
+        now = time.time() if now is None else now
+        with self._lock:
+            evicted = self._evict(now)
+            if evicted:
+                self._version += 1
+        for evicted_id in evicted:
+            if self.on_evict is not None:
+                self.on_evict(evicted_id)
+        return evicted
+
+    def get(self, device_id):
+        return self._records.get(device_id)
+
+    @property
+    def version(self):
+        """Bumped when a device joins or leaves, its reading or alarm changes, or its
+        last_seen moves to another minute; for callers caching something derived
+        from the records"""
+        return self._version
+
+    def alarming(self):
+        """Tuple of the records currently reporting alarm, sorted by device id"""
+        with self._lock:
+            records = [self._records[device_id] for device_id in self._alarming]
+        return tuple(sorted(records, key=lambda record: str(record.device_id)))
+
+    def silent(self, seconds, now=None):
+        """Tuple of the records not seen for at least `seconds`, sorted by device id"""
+        cutoff = (time.time() if now is None else now) - seconds
+        records = []
+        with self._lock:
+            for record in self._records.values():
+                if record.last_seen > cutoff:
+                    break
+                records.append(record)
+        return tuple(sorted(records, key=lambda record: str(record.device_id)))
+
+    def snapshot(self):
+        """Tuple of the current records sorted by device id"""
+        self.evict_expired()
+        records, version = self._snapshot
+        if version == self._version:
+            return records
+        with self._lock:
+            version = self._version
+            records = list(self._records.values())
+        records = tuple(sorted(records, key=lambda record: str(record.device_id)))
+        self._snapshot = (records, version)
+        return records
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,160 @@
+import math
+import threading
+from array import array
+from collections import namedtuple
+from itertools import compress, repeat
+from operator import and_, ge, gt, le, or_
+
+# rate is in units per minute
+Detection = namedtuple("Detection", ["device_id", "flagged", "temperature", "temperature_rate", "smoke", "smoke_rate"])
+
+
+class FireDetector:
+    """Rate-of-rise detection over the sensor stream.
+
+    ingest() keeps, per device, an exponentially weighted moving average of
+    temperature and smoke (time constant `smoothing` seconds) and of their
+    rate of change, in O(1). evaluate() then checks every device in one pass:
+    a device is flagged when its smoothed temperature climbs faster than
+    `temp_rate_raise` per minute, exceeds `temp_raise`, or its smoke rises
+    faster than `smoke_rate_raise` per minute, and is cleared only once all
+    of them are back below the lower *_clear thresholds.
+
+    Each channel's average is seeded from its first real reading and only
+    counts towards `min_samples` once it has had that many, so a message
+    without a temperature never makes the next one look like a jump from 0.
+
+    State is kept column-wise in arrays indexed by a per-device slot so the
+    pass over all devices runs as a handful of map() calls.
+    """
+
+    def __init__(self, smoothing=20.0, rate_smoothing=30.0, min_samples=5,
+                 temp_rate_raise=8.0, temp_rate_clear=3.0, temp_raise=57.0, temp_clear=50.0,
+                 smoke_rate_raise=5.0, smoke_rate_clear=1.0):
+        self.smoothing = smoothing
+        self.rate_smoothing = rate_smoothing
+        self.min_samples = min_samples
+        self.temp_rate_raise = temp_rate_raise
+        self.temp_rate_clear = temp_rate_clear
+        self.temp_raise = temp_raise
+        self.temp_clear = temp_clear
+        self.smoke_rate_raise = smoke_rate_raise
+        self.smoke_rate_clear = smoke_rate_clear
+        self._slots = {}      # device_id -> slot
+        self._ids = []        # slot -> device_id, None when free
+        self._free = []
+        self._temp_last = array("d")
+        self._temp_samples = array("I")
+        self._temp = array("d")
+        self._temp_rate = array("d")
+        self._smoke_last = array("d")
+        self._smoke_samples = array("I")
+        self._smoke = array("d")
+        self._smoke_rate = array("d")
+        self._flagged = array("b")
+        self._lock = threading.Lock()
+
+    def _slot(self, device_id):
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            return slot
+        columns = (self._temp_last, self._temp, self._temp_rate,
+                   self._smoke_last, self._smoke, self._smoke_rate)
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = device_id
+            for column in columns:
+                column[slot] = 0.0
+            self._temp_samples[slot] = self._smoke_samples[slot] = 0
+            self._flagged[slot] = 0
+        else:
+            slot = len(self._ids)
+            self._ids.append(device_id)
+            for column in columns:
+                column.append(0.0)
+            self._temp_samples.append(0)
+            self._smoke_samples.append(0)
+            self._flagged.append(0)
+        self._slots[device_id] = slot
+        return slot
+
+    def ingest(self, device_id, timestamp, temperature=None, smoke=None):
+        """Fold one reading into the device's averages; missing or non-finite values keep the previous ones"""
+        with self._lock:
+            slot = self._slot(device_id)
+            if temperature is not None and math.isfinite(temperature):
+                self._fold(slot, timestamp, temperature, self._temp, self._temp_rate,
+                           self._temp_samples, self._temp_last)
+            if smoke is not None and math.isfinite(smoke):
+                self._fold(slot, timestamp, smoke, self._smoke, self._smoke_rate,
+                           self._smoke_samples, self._smoke_last)
+
+    def _fold(self, slot, timestamp, value, average, rate, samples, last):
+        # caller holds the lock; the other arguments are one channel's columns
+        if samples[slot] == 0:
+            average[slot] = value
+        else:
+            dt = timestamp - last[slot]
+            if dt <= 0:
+                return
+            previous = average[slot]
+            average[slot] = previous + (1.0 - math.exp(-dt / self.smoothing)) * (value - previous)
+            slope = (average[slot] - previous) * 60.0 / dt
+            rate[slot] += (1.0 - math.exp(-dt / self.rate_smoothing)) * (slope - rate[slot])
+        last[slot] = timestamp
+        samples[slot] += 1
+
+    def evaluate(self):
+        """Check all devices; returns a Detection for each one whose flag changed"""
+        with self._lock:
+            # a channel only takes part once it has min_samples real readings
+            temp_warm = map(ge, self._temp_samples, repeat(self.min_samples))
+            smoke_warm = map(ge, self._smoke_samples, repeat(self.min_samples))
+            raise_now = map(or_,
+                map(and_, temp_warm, map(or_,
+                    map(ge, self._temp_rate, repeat(self.temp_rate_raise)),
+                    map(ge, self._temp, repeat(self.temp_raise)))),
+                map(and_, smoke_warm, map(ge, self._smoke_rate, repeat(self.smoke_rate_raise))))
+            calm = map(and_, map(and_,
+                map(le, self._temp_rate, repeat(self.temp_rate_clear)),
+                map(le, self._temp, repeat(self.temp_clear))),
+                map(le, self._smoke_rate, repeat(self.smoke_rate_clear)))
+            flagged = list(map(bool, self._flagged))
+            # raise where the condition holds and the device is not flagged yet,
+            # clear where it is flagged and everything is calm again
+            raised = list(compress(range(len(flagged)), map(gt, raise_now, flagged)))
+            cleared = list(compress(range(len(flagged)), map(and_, flagged, calm)))
+            changes = []
+            for slot in raised:
+                self._flagged[slot] = 1
+                changes.append(self._detection(slot))
+            for slot in cleared:
+                self._flagged[slot] = 0
+                changes.append(self._detection(slot))
+            return changes
+
+    def _detection(self, slot):
+        return Detection(self._ids[slot], bool(self._flagged[slot]), self._temp[slot],
+                         self._temp_rate[slot], self._smoke[slot], self._smoke_rate[slot])
+
+    def status(self, device_id):
+        """Current Detection for a device, or None if it was never seen"""
+        with self._lock:
+            slot = self._slots.get(device_id)
+            return None if slot is None else self._detection(slot)
+
+    def is_flagged(self, device_id):
+        slot = self._slots.get(device_id)
+        return slot is not None and bool(self._flagged[slot])
+
+    def forget(self, device_id):
+        with self._lock:
+            slot = self._slots.pop(device_id, None)
+            if slot is not None:
+                self._ids[slot] = None
+                self._temp_samples[slot] = self._smoke_samples[slot] = 0
+                self._flagged[slot] = 0
+                self._free.append(slot)
+
+    def __len__(self):
+        return len(self._slots)
@@ -0,0 +1,198 @@
+import heapq
+import json
+import logging
+import random
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows; there every process prefetches on its own
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastPrefetcher:
+    """Keeps the forecasts of active locations fresh in the background.
+
+    register(key) is called whenever a device asks for the forecast of a grid
+    cell. Every registered cell is refreshed `lead_time` seconds before it
+    would go stale (`interval` after the last refresh), minus a random
+    `stagger` so cells seen at the same time do not all refresh together, and
+    at most one upstream call starts every `min_spacing` seconds. Each result
+    is handed to publish(key, value), e.g. to push it to devices over MQTT.
+    Cells nobody asked for within `idle_timeout` are dropped.
+
+    With a PersistentStore the registry is kept in the store, so it survives
+    restarts and all worker processes feed it; only the process holding
+    `lock_path` runs the schedule.
+    """
+
+    def __init__(self, refresh, publish=None, interval=1800, lead_time=300, stagger=120,
+                 idle_timeout=3 * 86400, min_spacing=0.2, age=None, store=None,
+                 namespace="prefetch", lock_path=None, sync_interval=60):
+        self.refresh = refresh
+        self.publish = publish
+        self.interval = interval
+        self.lead_time = lead_time
+        self.stagger = stagger
+        self.idle_timeout = idle_timeout
+        self.min_spacing = min_spacing
+        self.age = age  # age(key) -> seconds since the cached value was stored, or None
+        self.store = store
+        self.namespace = namespace
+        self.lock_path = lock_path
+        self.sync_interval = sync_interval
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.publishes = 0
+        self.publish_errors = 0
+        self._last_seen = {}   # key -> wall-clock time of the last register()
+        self._persisted = {}   # key -> when register() last wrote it to the store
+        self._due = {}         # key -> monotonic time of the next refresh
+        self._heap = []        # (due, key), may hold outdated entries
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock_file = None
+        self._thread = None
+
+    def register(self, key):
+        """Mark a grid cell as in use; cheap enough to call on every request"""
+        now = time.time()
+        with self._lock:
+            self._last_seen[key] = now
+            new = key not in self._due
+            if new:
+                self._schedule(key, self._first_due(key))
+            persist = self.store is not None and now - self._persisted.get(key, 0) > self.sync_interval
+            if persist:
+                self._persisted[key] = now
+        if persist:
+            self.store.put(self.namespace, list(key), now, ttl=self.idle_timeout)
+        if new:
+            self._wakeup.set()
+
+    def _first_due(self, key):
+        age = self.age(key) if self.age else None
+        if age is None:
+            # spread the first round over the stagger window
+            return time.monotonic() + random.uniform(0, self.stagger)
+        return time.monotonic() + max(0, self.interval - self.lead_time - age) - random.uniform(0, self.stagger)
+
+    def _schedule(self, key, due):
+        # caller holds the lock
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="forecast-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def _is_leader(self):
+        if self.lock_path is None or fcntl is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            logger.info("Forecast prefetcher running in this process")
+        return True
+
+    def _sync(self):
+        """Merge locations other processes registered and drop idle ones"""
+        now = time.time()
+        if self.store is not None:
+            for key, last_seen, _ in self.store.load(self.namespace):
+                key = tuple(json.loads(key))
+                with self._lock:
+                    if last_seen > self._last_seen.get(key, 0):
+                        self._last_seen[key] = last_seen
+                    if key not in self._due:
+                        self._schedule(key, self._first_due(key))
+        with self._lock:
+            for key, last_seen in list(self._last_seen.items()):
+                if now - last_seen > self.idle_timeout:
+                    del self._last_seen[key]
+                    self._due.pop(key, None)
+                    self._persisted.pop(key, None)
+
+    def _run(self):
+        next_sync = 0
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            if now >= next_sync:
+                next_sync = now + self.sync_interval
+                if not self._is_leader():
+                    self._stopping.wait(self.sync_interval)
+                    continue
+                try:
+                    self._sync()
+                except Exception as e:
+                    logger.warning(f"Forecast prefetcher sync failed: {e}")
+
+            with self._lock:
+                # skip heap entries superseded by a later _schedule() or dropped as idle
+                while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                    heapq.heappop(self._heap)
+                due, key = self._heap[0] if self._heap else (next_sync, None)
+            if due > now:
+                self._wakeup.wait(min(due, next_sync) - now)
+                self._wakeup.clear()
+                continue
+
+            self._refresh(key)
+            self._stopping.wait(self.min_spacing)
+
+    def _refresh(self, key):
+        age = self.age(key) if self.age else None
+        if age is not None and age < self.interval - self.lead_time - self.stagger:
+            # another process fetched it since it was scheduled
+            with self._lock:
+                if key in self._due:
+                    self._schedule(key, self._first_due(key))
+            return
+        try:
+            value = self.refresh(key)
+            self.refreshes += 1
+            delay = self.interval - self.lead_time - random.uniform(0, self.stagger)
+        except Exception as e:
+            # try again well before the cached copy runs out
+            self.refresh_errors += 1
+            logger.warning(f"Prefetching forecast for {key} failed: {e}")
+            value = None
+            delay = min(self.lead_time, 60)
+        with self._lock:
+            if key in self._due:
+                self._schedule(key, time.monotonic() + max(delay, self.min_spacing))
+
+        if value is not None and self.publish is not None:
+            try:
+                self.publish(key, value)
+                self.publishes += 1
+            except Exception as e:
+                self.publish_errors += 1
+                logger.warning(f"Publishing forecast for {key} failed: {e}")
+
+    def __len__(self):
+        return len(self._due)
+
+    def stats(self):
+        return {
+            "locations": len(self._due),
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "publishes": self.publishes,
+            "publish_errors": self.publish_errors,
+        }
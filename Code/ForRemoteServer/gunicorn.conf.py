@@ -0,0 +1,39 @@
+"""Production settings for time_server.
+
+    gunicorn -c gunicorn.conf.py time_server:app
+
+Each worker process serves requests from a pool of threads, so a slow
+upstream call only ties up one thread. The workers share geo, forecast and
+calendar entries and their metrics through the SQLite store configured by
+PERSISTENT_CACHE_PATH in time_server.py, so adding workers does not multiply
+upstream calls.
+
+Graceful reload: `kill -HUP <master pid>` starts new workers with the
+reloaded code and lets the old ones finish their requests first.
+"""
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+workers = min(multiprocessing.cpu_count() * 2, 8)
+worker_class = "gthread"
+threads = 16
+timeout = 30
+# in-flight requests get this long to finish on reload or shutdown
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then; the shared store keeps the new ones warm
+max_requests = 20000
+max_requests_jitter = 2000
+
+# the app starts background threads (log listener, store writer), which do
+# not survive fork, so every worker imports it itself
+preload_app = False
+
+
+def worker_exit(server, worker):
+    """Keep the worker's counters and commit queued cache writes before it goes away"""
+    import sys
+    time_server = sys.modules.get("time_server")
+    if time_server is not None and time_server.persistent_store is not None:
+        time_server.archive_metrics()
+        time_server.persistent_store.close()
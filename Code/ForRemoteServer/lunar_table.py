@@ -0,0 +1,162 @@
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from lunarcalendar import Solar, Converter
+
+# range of Gregorian dates lunarcalendar converts correctly
+FIRST_SUPPORTED_DAY = date(1900, 1, 31)
+LAST_SUPPORTED_DAY = date(2100, 12, 31)
+
+ZODIAC_EN = ["Rat", "Ox", "Tiger", "Rabbit", "Dragon", "Snake",
+             "Horse", "Goat", "Monkey", "Rooster", "Dog", "Pig"]
+
+# solar_term is the term in effect at local midnight; term_change is the
+# timestamp at which the next term starts if that happens during the day
+CalendarDay = namedtuple("CalendarDay", [
+    "year", "month", "day", "weekday",
+    "lunar_year", "lunar_month", "lunar_day", "lunar_leap", "zodiac",
+    "solar_term", "term_change",
+])
+
+# column order of the compact rows served by /calendar
+CALENDAR_FIELDS = [
+    "year", "month", "day", "weekday",
+    "lunar_year", "lunar_month", "lunar_day", "lunar_leap", "zodiac",
+    "solar_term", "term_change",
+]
+
+
+def calendar_row(entry):
+    """Compact list form of a CalendarDay.
+
+    weekday counts from 0 = Sunday like struct tm, zodiac indexes ZODIAC_EN,
+    and term_change is the minute of the day at which the next solar term
+    starts, or -1 if the term does not change that day.
+    """
+    if entry.term_change is None:
+        term_change = -1
+    else:
+        change = datetime.fromtimestamp(entry.term_change)
+        term_change = change.hour * 60 + change.minute
+    return [
+        entry.year, entry.month, entry.day,
+        date(entry.year, entry.month, entry.day).isoweekday() % 7,
+        entry.lunar_year, entry.lunar_month, entry.lunar_day,
+        int(entry.lunar_leap), (entry.lunar_year - 4) % 12,
+        entry.solar_term, term_change,
+    ]
+
+
+class LunarCalendar:
+    """Per-day memo of the lunar date, zodiac and solar term.
+
+    Everything /time needs only changes once a day, so each Gregorian day is
+    converted once. Days from yesterday up to window_days ahead are kept;
+    older days are dropped when the date rolls over.
+
+    With a PersistentStore the computed days are saved under `namespace`, so
+    warm() after a restart only converts days it has not seen before.
+    """
+
+    def __init__(self, solar_terms, window_days=1100, store=None, namespace="lunar"):
+        self.solar_terms = solar_terms
+        self.window_days = window_days
+        self.store = store
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._days = {}
+        self._today = None
+        self._lock = threading.Lock()
+
+    def warm(self, start=None, days=None):
+        """Precompute the window starting at `start` (default: yesterday)"""
+        today = date.today()
+        if today != self._today:
+            self._roll_over(today)
+        start = start or today - timedelta(days=1)
+        end = start + timedelta(days=self.window_days if days is None else days)
+        if self.store is not None:
+            for key, fields, _ in self.store.load(self.namespace):
+                d = date.fromisoformat(key)
+                if start <= d < end:
+                    self._days.setdefault(d, CalendarDay(*fields))
+        d = start
+        while d < end:
+            if d not in self._days:
+                entry = self._days[d] = self._compute(d)
+                if self.store is not None:
+                    self.store.put(self.namespace, d.isoformat(), list(entry))
+            d += timedelta(days=1)
+
+    def day(self, d):
+        """Return the CalendarDay for a datetime.date"""
+        today = date.today()
+        if today != self._today:
+            self._roll_over(today)
+
+        entry = self._days.get(d)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = self._compute(d)
+        if today - timedelta(days=1) <= d < today + timedelta(days=self.window_days):
+            self._days[d] = entry
+        return entry
+
+    def days(self, start, count):
+        """Yield CalendarDay entries for `count` consecutive days from `start`"""
+        for offset in range(count):
+            yield self.day(start + timedelta(days=offset))
+
+    def solar_term_at(self, entry, timestamp):
+        """Solar term index at `timestamp`, which must fall on entry's day"""
+        if entry.term_change is not None and timestamp >= entry.term_change:
+            return (entry.solar_term + 1) % 24
+        return entry.solar_term
+
+    def _compute(self, d):
+        if not FIRST_SUPPORTED_DAY <= d <= LAST_SUPPORTED_DAY:
+            raise ValueError(f"{d} is outside {FIRST_SUPPORTED_DAY}..{LAST_SUPPORTED_DAY}")
+        lunar_date = Converter.Solar2Lunar(Solar(d.year, d.month, d.day))
+
+        midnight = datetime(d.year, d.month, d.day).timestamp()
+        next_midnight = datetime.combine(d + timedelta(days=1), datetime.min.time()).timestamp()
+        next_term = self.solar_terms.next_start(midnight)
+
+        return CalendarDay(
+            year=d.year,
+            month=d.month,
+            day=d.day,
+            weekday=d.strftime("%A"),
+            lunar_year=lunar_date.year,
+            lunar_month=lunar_date.month,
+            lunar_day=lunar_date.day,
+            lunar_leap=bool(lunar_date.isleap),
+            zodiac=ZODIAC_EN[(lunar_date.year - 4) % 12],
+            solar_term=self.solar_terms.term_at(midnight),
+            term_change=next_term if next_term < next_midnight else None,
+        )
+
+    def _roll_over(self, today):
+        with self._lock:
+            if today == self._today:
+                return
+            oldest = today - timedelta(days=1)
+            self._days = {d: entry for d, entry in self._days.items() if d >= oldest}
+            self._today = today
+
+    def __len__(self):
+        return len(self._days)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._days),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,227 @@
+"""Minimal Prometheus-style metrics: counters, gauges and histograms with
+labels, rendered in the text exposition format by Registry.render().
+
+Each labelled child has its own small lock, so threads updating different
+series never contend and an update is a single short critical section.
+Registry.collect() returns plain data that can be shipped between worker
+processes and combined with merge_families().
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register a callable returning [(name, type, help, [(labels, value), ...]), ...]
+        that is evaluated at scrape time, e.g. to export cache statistics"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def collect(self):
+        """Return every family as (name, type, help, [(sample_name, labels, value), ...])"""
+        families = []
+        for metric in list(self._metrics):
+            families.append((metric.name, metric.kind, metric.documentation, metric.samples()))
+        for collect in list(self._collectors):
+            for name, kind, documentation, samples in collect():
+                families.append((name, kind, documentation, [(name, labels, value) for labels, value in samples]))
+        return families
+
+    def render(self, families=None):
+        lines = []
+        for name, kind, documentation, samples in (self.collect() if families is None else families):
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_families(snapshots):
+    """Combine collect() results from several processes, given as (worker, families).
+
+    Counters and histograms are summed; gauges keep one series per worker
+    under an extra `worker` label since e.g. hit ratios do not add up.
+    """
+    merged = {}
+    for worker, families in snapshots:
+        for name, kind, documentation, samples in families:
+            series = merged.setdefault(name, (kind, documentation, {}))[2]
+            for sample_name, labels, value in samples:
+                if kind == "gauge":
+                    labels = dict(labels, worker=worker)
+                key = (sample_name, tuple(labels.items()))
+                series[key] = series.get(key, 0) + value
+    return [
+        (name, kind, documentation, [(sample_name, dict(labels), value)
+                                     for (sample_name, labels), value in series.items()])
+        for name, (kind, documentation, series) in merged.items()
+    ]
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        registry.register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self):
+        samples = []
+        for key, child in sorted(self._children.items()):
+            self._child_samples(samples, dict(zip(self.labelnames, key)), child)
+        return samples
+
+    def _child_samples(self, samples, labels, child):
+        samples.append((self.name, labels, child.get()))
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def get(self):
+        return self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _child_samples(self, samples, labels, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(float(bound))), cumulative))
+        samples.append((f"{self.name}_sum", labels, total))
+        samples.append((f"{self.name}_count", labels, cumulative))
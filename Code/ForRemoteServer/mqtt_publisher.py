@@ -0,0 +1,216 @@
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+
+def new_client(client_id=""):
+    """mqtt.Client for the 1.x callback signatures used in this repo"""
+    # paho-mqtt 2.x wants the callback API version spelled out
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+
+class _Outgoing:
+    __slots__ = ("topic", "payload", "qos", "retain", "deadline", "future", "sent_at")
+
+    def __init__(self, topic, payload, qos, retain, deadline):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.deadline = deadline
+        self.future = Future()
+        self.sent_at = None
+
+
+class MqttPublisher:
+    """One long-lived MQTT connection for publishing.
+
+    The network loop runs on paho's own thread and reconnects by itself.
+    publish() returns a Future that resolves to the round-trip time in
+    seconds once the broker acknowledges the message (PUBACK for QoS 1), or
+    fails with TimeoutError when that does not happen within `timeout`.
+    Messages published while disconnected wait in a bounded backlog and are
+    sent on reconnect unless their timeout has passed by then, so a stale
+    command is never delivered late. A timer thread fails messages at their
+    deadline, so a lost acknowledgement never leaves a Future pending.
+    """
+
+    def __init__(self, broker, port=1883, username=None, password=None, client_id="",
+                 keepalive=60, max_queued=1000):
+        self.broker = broker
+        self.port = port
+        self.connected = False
+        self.published = 0
+        self.timeouts = 0
+        self.dropped = 0
+        self._backlog = deque()
+        self._max_queued = max_queued
+        self._pending = {}  # mid -> _Outgoing waiting for its acknowledgement
+        self._acked = {}  # mid -> time, acknowledged before publish() got to register it
+        self._deadlines = []  # heap of the deadlines of messages published with a timeout
+        self._closed = False
+        # paho calls on_publish while holding its own message lock, so this lock
+        # is never held across a call into the client
+        self._lock = threading.Condition()
+        self._timer = threading.Thread(target=self._expire_loop, name="mqtt-publisher", daemon=True)
+        self._timer.start()
+        self.client = new_client(client_id)
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.connect_async(broker, port, keepalive)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.warning(f"MQTT publisher connection refused, code {rc}")
+            return
+        logger.info(f"MQTT publisher connected to {self.broker}:{self.port}")
+        with self._lock:
+            self.connected = True
+            backlog, self._backlog = self._backlog, deque()
+        for item in backlog:
+            self._send(item)
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            self.connected = False
+        if rc != 0:
+            logger.warning(f"MQTT publisher lost connection (code {rc}), reconnecting")
+
+    def _on_publish(self, client, userdata, mid):
+        with self._lock:
+            item = self._pending.pop(mid, None)
+            if item is None:
+                # the PUBACK overtook _send(), which claims it from here
+                self._acked[mid] = time.monotonic()
+                self._lock.notify()
+        if item is not None:
+            self._resolve(item)
+
+    def _resolve(self, item):
+        if not item.future.done():
+            self.published += 1
+            item.future.set_result(time.monotonic() - item.sent_at)
+
+    def publish(self, topic, payload, qos=1, retain=False, timeout=None):
+        """Send a message and return a Future for its acknowledgement"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        item = _Outgoing(topic, payload, qos, retain, deadline)
+        with self._lock:
+            if deadline is not None:
+                heapq.heappush(self._deadlines, deadline)
+                self._lock.notify()
+            connected = self.connected
+            if not connected:
+                if len(self._backlog) < self._max_queued:
+                    self._backlog.append(item)
+                else:
+                    self.dropped += 1
+                    item.future.set_exception(RuntimeError("MQTT publisher backlog is full"))
+        if connected:
+            self._send(item)
+        return item.future
+
+    def _send(self, item):
+        # called without the lock, see __init__
+        if item.deadline is not None and time.monotonic() >= item.deadline:
+            self._fail(item)
+            return
+        item.sent_at = time.monotonic()
+        info = self.client.publish(item.topic, item.payload, qos=item.qos, retain=item.retain)
+        if info.rc == mqtt.MQTT_ERR_NO_CONN:
+            # dropped between the connected check and the write; paho keeps
+            # QoS > 0 messages and resends them once reconnected
+            if item.qos == 0:
+                with self._lock:
+                    self._backlog.appendleft(item)
+                return
+        elif info.rc != mqtt.MQTT_ERR_SUCCESS:
+            item.future.set_exception(RuntimeError(mqtt.error_string(info.rc)))
+            return
+        with self._lock:
+            acked = self._acked.pop(info.mid, None) is not None
+            # the timer may have passed this deadline while the message was being written
+            late = item.deadline is not None and time.monotonic() >= item.deadline
+            if item.qos > 0 and not acked and not late:
+                self._pending[info.mid] = item
+        # nothing comes back for QoS 0, handing it to the socket is all there is
+        if item.qos == 0 or acked:
+            self._resolve(item)
+        elif late:
+            self._fail(item)
+
+    def _expire_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0] <= now:
+                    heapq.heappop(self._deadlines)
+                expired = self._expire(now)
+                if not expired:
+                    # sleep until the next deadline, or until publish() adds an earlier one;
+                    # wake up now and then while unclaimed acknowledgements need pruning
+                    wait = self._deadlines[0] - now if self._deadlines else None
+                    if self._acked:
+                        wait = 60 if wait is None else min(wait, 60)
+                    self._lock.wait(wait)
+            for item in expired:
+                self._fail(item)
+
+    def _expire(self, now):
+        # caller holds the lock; returns the items to fail once it is released
+        expired = []
+        for mid, item in list(self._pending.items()):
+            if item.deadline is not None and now >= item.deadline:
+                del self._pending[mid]
+                expired.append(item)
+        if any(item.deadline is not None and now >= item.deadline for item in self._backlog):
+            backlog, self._backlog = self._backlog, deque()
+            for item in backlog:
+                if item.deadline is not None and now >= item.deadline:
+                    expired.append(item)
+                else:
+                    self._backlog.append(item)
+        # acknowledgements nobody claimed, e.g. QoS 0 or messages already timed out
+        for mid, acked_at in list(self._acked.items()):
+            if now - acked_at > 60:
+                del self._acked[mid]
+        return expired
+
+    def _fail(self, item):
+        self.timeouts += 1
+        if not item.future.done():
+            item.future.set_exception(TimeoutError(f"no acknowledgement for {item.topic} in time"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connected": self.connected,
+                "published": self.published,
+                "pending": len(self._pending),
+                "queued": len(self._backlog),
+                "timeouts": self.timeouts,
+                "dropped": self.dropped,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        self.client.disconnect()
+        self.client.loop_stop()
@@ -0,0 +1,251 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    stored_at  REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at);
+"""
+
+_STOP = object()
+
+
+def encode_key(key):
+    """Stable text form of a cache key (str, number, tuple, date...)"""
+    return key if isinstance(key, str) else json.dumps(key, default=str)
+
+
+def connect(path):
+    """SQLite connection in WAL mode, usable from any thread"""
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class BatchWriter:
+    """Background thread that commits queued rows in groups.
+
+    put() never blocks: rows are dropped and counted when the queue is full.
+    The thread takes whatever is queued (up to batch_size rows), writes it
+    with write(conn, rows) in one transaction, and calls maintain(conn)
+    every maintain_interval seconds.
+    """
+
+    def __init__(self, path, write, maintain=None, flush_interval=0.5, batch_size=500,
+                 queue_size=10000, maintain_interval=600, name="sqlite-writer"):
+        self.path = path
+        self.write = write
+        self.maintain = maintain
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.maintain_interval = maintain_interval
+        self.writes = 0
+        self.commits = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been committed"""
+        done = threading.Event()
+        self._queue.put(done, timeout=timeout)
+        done.wait(timeout)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5.0)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        conn = connect(self.path)
+        last_maintain = time.monotonic()
+        running = True
+        while running:
+            batch, waiters = [], []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            while item is not None:
+                if item is _STOP:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if batch:
+                try:
+                    with conn:
+                        self.write(conn, batch)
+                    self.writes += len(batch)
+                    self.commits += 1
+                except sqlite3.Error as e:
+                    logger.warning(f"Write of {len(batch)} rows to {self.path} failed: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+            if self.maintain is not None and time.monotonic() - last_maintain >= self.maintain_interval:
+                self.maintain(conn)
+                last_maintain = time.monotonic()
+        conn.close()
+
+
+class PersistentStore:
+    """SQLite (WAL mode) backing store for the in-memory caches.
+
+    Reads go straight to the database on the calling thread. Writes are queued
+    and committed in batches by one background thread, so a request never
+    waits on the disk. Several worker processes can open the same file and
+    share what each of them has fetched. Expired rows are deleted every
+    compact_interval seconds.
+    """
+
+    def __init__(self, path, flush_interval=0.5, batch_size=500, queue_size=10000,
+                 compact_interval=600):
+        self.path = path
+        self.reads = 0
+        self.read_hits = 0
+        self._local = threading.local()
+
+        conn = connect(path)
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+        self._writer = BatchWriter(
+            path, self._write, maintain=self.compact, flush_interval=flush_interval,
+            batch_size=batch_size, queue_size=queue_size, maintain_interval=compact_interval,
+            name="persistent-store")
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def get(self, namespace, key):
+        """Return (value, stored_at, expires_at) for an unexpired entry, or None"""
+        self.reads += 1
+        try:
+            row = self._reader().execute(
+                "SELECT value, stored_at, expires_at FROM entries WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, encode_key(key), time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        self.read_hits += 1
+        return json.loads(row[0]), row[1], row[2]
+
+    def load(self, namespace):
+        """Yield (key, value, stored_at) for every unexpired entry in a namespace"""
+        rows = self._reader().execute(
+            "SELECT key, value, stored_at FROM entries WHERE namespace = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time()),
+        )
+        for key, value, stored_at in rows:
+            yield key, json.loads(value), stored_at
+
+    def put(self, namespace, key, value, ttl=None, stored_at=None):
+        """Queue an entry for writing; ttl=None keeps it until replaced"""
+        stored_at = time.time() if stored_at is None else stored_at
+        expires_at = None if ttl is None else stored_at + ttl
+        self._writer.put((namespace, encode_key(key), json.dumps(value), stored_at, expires_at))
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been committed"""
+        self._writer.flush(timeout)
+
+    def update(self, namespace, key, update, delete=()):
+        """Replace an entry with update(current value or None) and delete the
+        `delete` keys of the namespace, in one transaction no other process can
+        interleave with. Bypasses the write queue; returns the new value, or
+        None if the write failed."""
+        self.flush()
+        conn = self._reader()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM entries WHERE namespace = ? AND key = ? "
+                    "AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, encode_key(key), time.time()),
+                ).fetchone()
+                value = update(None if row is None else json.loads(row[0]))
+                self._write(conn, [(namespace, encode_key(key), json.dumps(value), time.time(), None)])
+                conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?",
+                                 [(namespace, encode_key(other)) for other in delete])
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent cache update failed: {e}")
+            return None
+        return value
+
+    def close(self):
+        self._writer.close()
+
+    @staticmethod
+    def _write(conn, rows):
+        conn.executemany(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, stored_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def compact(self, conn=None):
+        """Delete expired entries and checkpoint the WAL"""
+        conn = conn or self._reader()
+        try:
+            with conn:
+                deleted = conn.execute(
+                    "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                    (time.time(),)).rowcount
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if deleted:
+                logger.info(f"Persistent cache compacted, {deleted} expired entries removed")
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent cache compaction failed: {e}")
+
+    def stats(self):
+        return {
+            "reads": self.reads,
+            "read_hits": self.read_hits,
+            "writes": self._writer.writes,
+            "dropped": self._writer.dropped,
+            "queued": self._writer.qsize(),
+        }
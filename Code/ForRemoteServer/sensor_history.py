@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from itertools import compress
+from operator import and_, eq
+
+CHANNELS = ("temperature", "smoke")
+# (bucket width in seconds, number of buckets): 15 minutes by 10 s, 24 hours by 5 minutes,
+# 7 days by hour; devices report every few seconds, so finer buckets would mostly stay empty
+DEFAULT_LEVELS = ((10, 90), (300, 288), (3600, 168))
+
+Summary = namedtuple("Summary", ["count", "min", "max", "mean", "resolution"])
+
+
+class _Level:
+    """Ring of fixed-width time buckets; each bucket keeps count/min/max/sum
+    per channel, so any window can be summarised exactly from the buckets"""
+
+    __slots__ = ("width", "size", "bucket", "count", "low", "high", "total")
+
+    def __init__(self, width, size, channels):
+        self.width = width
+        self.size = size
+        self.bucket = array("q", [-1]) * size  # bucket number held by each slot
+        self.count = [array("I", [0]) * size for _ in range(channels)]
+        self.low = [array("f", [0.0]) * size for _ in range(channels)]
+        self.high = [array("f", [0.0]) * size for _ in range(channels)]
+        self.total = [array("f", [0.0]) * size for _ in range(channels)]
+
+    def add(self, timestamp, values):
+        number = int(timestamp // self.width)
+        slot = number % self.size
+        if self.bucket[slot] != number:
+            # the slot still holds a bucket from one full ring ago
+            self.bucket[slot] = number
+            for count in self.count:
+                count[slot] = 0
+        for channel, value in enumerate(values):
+            if value is None:
+                continue
+            n = self.count[channel][slot]
+            if n == 0:
+                self.low[channel][slot] = self.high[channel][slot] = self.total[channel][slot] = value
+            else:
+                if value < self.low[channel][slot]:
+                    self.low[channel][slot] = value
+                if value > self.high[channel][slot]:
+                    self.high[channel][slot] = value
+                self.total[channel][slot] += value
+            self.count[channel][slot] = n + 1
+
+    def span(self):
+        return self.width * self.size
+
+    def summary(self, channel, since, until):
+        last = int(until // self.width)
+        first = max(int(since // self.width), last - self.size + 1)
+        if first > last:
+            return Summary(0, None, None, None, self.width)
+
+        # buckets first..last occupy at most two contiguous runs of slots
+        start = first % self.size
+        length = last - first + 1
+        runs = [(start, min(self.size, start + length), first)]
+        if start + length > self.size:
+            runs.append((0, start + length - self.size, first + self.size - start))
+
+        count, low, high, total = 0, None, None, 0.0
+        for begin, end, number in runs:
+            counts = self.count[channel][begin:end]
+            # a slot counts if it holds the expected bucket and has samples for this channel
+            selected = list(map(and_, map(eq, self.bucket[begin:end], range(number, number + end - begin)),
+                                map(bool, counts)))
+            if not any(selected):
+                continue
+            count += sum(compress(counts, selected))
+            total += sum(compress(self.total[channel][begin:end], selected))
+            run_low = min(compress(self.low[channel][begin:end], selected))
+            run_high = max(compress(self.high[channel][begin:end], selected))
+            low = run_low if low is None else min(low, run_low)
+            high = run_high if high is None else max(high, run_high)
+        return Summary(count, low, high, total / count if count else None, self.width)
+
+
+class DeviceHistory:
+    """Fixed-memory history of one device's readings at several resolutions"""
+
+    __slots__ = ("levels",)
+
+    def __init__(self, levels=DEFAULT_LEVELS, channels=len(CHANNELS)):
+        self.levels = [_Level(width, size, channels) for width, size in levels]
+
+    def add(self, timestamp, values):
+        for level in self.levels:
+            level.add(timestamp, values)
+
+    def summary(self, channel, window, now=None):
+        """min/max/mean over the last `window` seconds from the finest level that covers it"""
+        now = time.time() if now is None else now
+        level = next((level for level in self.levels if level.span() >= window), self.levels[-1])
+        return level.summary(channel, now - window, now)
+
+
+class SensorHistory:
+    """Per-device DeviceHistory objects. Memory is fixed per device: about
+    40 bytes per bucket with the default two channels, ~22 KB with DEFAULT_LEVELS.
+    At most `max_devices` histories are kept; the device updated least
+    recently loses its history first."""
+
+    def __init__(self, levels=DEFAULT_LEVELS, channels=CHANNELS, max_devices=None):
+        self.levels = levels
+        self.channels = channels
+        self.max_devices = max_devices
+        self._devices = OrderedDict()  # least recently updated first
+        self._lock = threading.Lock()
+
+    def add(self, device_id, readings, timestamp=None):
+        """Record one message; readings maps channel name to a number (missing or non-numeric is skipped)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        values = [to_number(readings.get(channel)) for channel in self.channels]
+        with self._lock:
+            history = self._devices.get(device_id)
+            if history is None:
+                if self.max_devices is not None and len(self._devices) >= self.max_devices:
+                    self._devices.popitem(last=False)
+                history = self._devices[device_id] = DeviceHistory(self.levels, len(self.channels))
+            else:
+                self._devices.move_to_end(device_id)
+            history.add(timestamp, values)
+
+    def summary(self, device_id, window, now=None):
+        """{channel: Summary} for the last `window` seconds, or None for an unknown device"""
+        with self._lock:
+            history = self._devices.get(device_id)
+            if history is None:
+                return None
+            return {channel: history.summary(index, window, now) for index, channel in enumerate(self.channels)}
+
+    def max_window(self):
+        return self.levels[-1][0] * self.levels[-1][1]
+
+    def forget(self, device_id):
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def __len__(self):
+        return len(self._devices)
+
+
+def to_number(value):
+    """float of a reading; None for missing, boolean, non-numeric and non-finite values"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
@@ -0,0 +1,144 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from persistent_store import BatchWriter, connect
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    time        REAL NOT NULL,
+    device_id   TEXT NOT NULL,
+    temperature REAL,
+    smoke       REAL,
+    alarm       INTEGER NOT NULL,
+    payload     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS readings_device_time ON readings (device_id, time);
+CREATE INDEX IF NOT EXISTS readings_time ON readings (time);
+"""
+
+# payload is the message as received on the sensor topic
+Reading = namedtuple("Reading", ["time", "device_id", "temperature", "smoke", "alarm", "payload"])
+
+
+class SensorStore:
+    """Append-only SQLite (WAL mode) log of every sensor message.
+
+    append() only queues the row; a background thread commits whatever has
+    queued up in one transaction, so the MQTT thread never waits on the disk
+    and a burst of messages costs one fsync. Rows older than `retention`
+    seconds are deleted every compact_interval seconds, in chunks so readers
+    and the WAL never see one huge transaction.
+    """
+
+    def __init__(self, path, retention=30 * 86400, flush_interval=0.5, batch_size=1000,
+                 queue_size=50000, compact_interval=3600, compact_chunk=10000):
+        self.path = path
+        self.retention = retention
+        self.compact_chunk = compact_chunk
+        self.removed = 0
+        self._local = threading.local()
+
+        conn = connect(path)
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+        self._writer = BatchWriter(
+            path, self._write, maintain=self.compact, flush_interval=flush_interval,
+            batch_size=batch_size, queue_size=queue_size, maintain_interval=compact_interval,
+            name="sensor-store")
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def append(self, device_id, temperature=None, smoke=None, alarm=False, payload="", timestamp=None):
+        """Queue one reading; returns False if the queue is full and it was dropped"""
+        timestamp = time.time() if timestamp is None else timestamp
+        if not isinstance(payload, str):
+            payload = json.dumps(payload, default=str)
+        return self._writer.put((timestamp, str(device_id), temperature, smoke, int(bool(alarm)), payload))
+
+    @staticmethod
+    def _write(conn, rows):
+        conn.executemany(
+            "INSERT INTO readings (time, device_id, temperature, smoke, alarm, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def query(self, device_id=None, since=None, until=None, limit=None):
+        """Readings in time order, optionally for one device and within [since, until)"""
+        clauses, params = [], []
+        if device_id is not None:
+            clauses.append("device_id = ?")
+            params.append(str(device_id))
+        if since is not None:
+            clauses.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("time < ?")
+            params.append(until)
+        sql = "SELECT time, device_id, temperature, smoke, alarm, payload FROM readings"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY time"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            rows = self._reader().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Sensor store query failed: {e}")
+            return []
+        return [Reading(t, device, temperature, smoke, bool(alarm), payload)
+                for t, device, temperature, smoke, alarm, payload in rows]
+
+    def devices(self):
+        """Device ids with at least one stored reading"""
+        rows = self._reader().execute("SELECT DISTINCT device_id FROM readings ORDER BY device_id")
+        return [device_id for device_id, in rows]
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been committed"""
+        self._writer.flush(timeout)
+
+    def close(self):
+        self._writer.close()
+
+    def compact(self, conn=None, now=None):
+        """Delete readings older than the retention period and checkpoint the WAL"""
+        conn = conn or self._reader()
+        cutoff = (time.time() if now is None else now) - self.retention
+        deleted = 0
+        try:
+            while True:
+                with conn:
+                    count = conn.execute(
+                        "DELETE FROM readings WHERE rowid IN "
+                        "(SELECT rowid FROM readings WHERE time < ? LIMIT ?)",
+                        (cutoff, self.compact_chunk)).rowcount
+                deleted += count
+                if count < self.compact_chunk:
+                    break
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logger.warning(f"Sensor store compaction failed: {e}")
+        if deleted:
+            self.removed += deleted
+            logger.info(f"Sensor store compacted, {deleted} readings older than {self.retention}s removed")
+        return deleted
+
+    def stats(self):
+        return {
+            "written": self._writer.writes,
+            "commits": self._writer.commits,
+            "dropped": self._writer.dropped,
+            "queued": self._writer.qsize(),
+            "removed": self.removed,
+        }
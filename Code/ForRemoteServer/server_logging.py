@@ -0,0 +1,50 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: records are dropped and
+    counted when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(log_file, level=logging.INFO, max_bytes=5 * 1024 * 1024,
+                  backup_count=5, queue_size=10000):
+    """Send all logging through a bounded queue to a background thread that
+    writes a size-rotated log file and the console.
+
+    Returns the queue handler so callers can read its dropped counter.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener.start()
+    # flush what is still queued when the process exits
+    atexit.register(listener.stop)
+    return queue_handler
@@ -0,0 +1,69 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call.
+
+    The first caller for a key runs fn(); callers arriving while it is still
+    running wait for it and receive the same result, or the same exception.
+    """
+
+    def __init__(self, timeout=15.0):
+        self.timeout = timeout
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() for key, or wait up to timeout seconds for the call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out waiting for in-flight request {key!r}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def stats(self):
+        """Return a snapshot of the coalescing counters"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+            }
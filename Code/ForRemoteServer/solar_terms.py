@@ -0,0 +1,166 @@
+import json
+import math
+import os
+import threading
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+# Index order matches the table the clock firmware uses: term 0 is Minor Cold,
+# when the sun's apparent ecliptic longitude reaches 285 degrees.
+SOLAR_TERM_NAMES = [
+    "Minor Cold", "Major Cold", "Beginning of Spring", "Rain Water",
+    "Awakening of Insects", "Spring Equinox", "Pure Brightness", "Grain Rain",
+    "Beginning of Summer", "Grain Full", "Grain in Ear", "Summer Solstice",
+    "Minor Heat", "Major Heat", "Beginning of Autumn", "End of Heat",
+    "White Dew", "Autumn Equinox", "Cold Dew", "Frost's Descent",
+    "Beginning of Winter", "Minor Snow", "Major Snow", "Winter Solstice",
+]
+
+J2000 = 2451545.0
+UNIX_EPOCH_JD = 2440587.5
+TROPICAL_YEAR = 365.2422
+DELTA_T = 69.0 / 86400  # TT - UT in days, close enough for minute precision
+
+# Generated with `python solar_terms.py 2000 2100` (needs the optional ephem
+# package); years outside it fall back to the low-precision formula below,
+# which is within about 15 minutes.
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solar_terms.json")
+
+
+def term_longitude(index):
+    return (285 + 15 * index) % 360
+
+
+def sun_apparent_longitude(jd):
+    """Apparent geocentric longitude of the sun in degrees (Meeus, ch. 25)"""
+    t = (jd + DELTA_T - J2000) / 36525
+    l0 = 280.46646 + 36000.76983 * t + 0.0003032 * t * t
+    m = math.radians(357.52911 + 35999.05029 * t - 0.0001537 * t * t)
+    c = ((1.914602 - 0.004817 * t - 0.000014 * t * t) * math.sin(m)
+         + (0.019993 - 0.000101 * t) * math.sin(2 * m)
+         + 0.000289 * math.sin(3 * m))
+    omega = math.radians(125.04 - 1934.136 * t)
+    return (l0 + c - 0.00569 - 0.00478 * math.sin(omega)) % 360
+
+
+def solar_term_time(year, index):
+    """Unix timestamp at which solar term `index` begins in Gregorian `year`"""
+    target = term_longitude(index)
+    # the terms are ~15.2 days apart starting around January 5th
+    jd = datetime(year, 1, 5, tzinfo=timezone.utc).timestamp() / 86400 + UNIX_EPOCH_JD
+    jd += index * TROPICAL_YEAR / 24
+    for _ in range(10):
+        diff = (target - sun_apparent_longitude(jd) + 180) % 360 - 180
+        jd += diff * TROPICAL_YEAR / 360
+        if abs(diff) < 1e-7:
+            break
+    return (jd - UNIX_EPOCH_JD) * 86400
+
+
+def load_table(path=DEFAULT_TABLE):
+    """Return {year: [24 start timestamps]} from a generated table, or {} if missing"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    first_year = data["first_year"]
+    return {first_year + i: row for i, row in enumerate(data["starts"])}
+
+
+def generate_table(first_year, last_year, path=DEFAULT_TABLE):
+    """Write a minute-accurate table of term start times computed with ephem"""
+    import ephem
+
+    def longitude(date):
+        sun = ephem.Sun(date)
+        ecl = ephem.Ecliptic(ephem.Equatorial(sun.ra, sun.dec, epoch=date), epoch=date)
+        return math.degrees(ecl.lon)
+
+    rows = []
+    for year in range(first_year, last_year + 1):
+        row = []
+        for index in range(24):
+            target = term_longitude(index)
+            # start from the formula's estimate, then refine against ephem
+            date = ephem.Date(datetime.fromtimestamp(solar_term_time(year, index), timezone.utc)
+                              .replace(tzinfo=None))
+            for _ in range(10):
+                diff = (target - longitude(date) + 180) % 360 - 180
+                date = ephem.Date(date + diff * TROPICAL_YEAR / 360)
+                if abs(diff) < 1e-7:
+                    break
+            row.append(round((float(date) + ephem.julian_date(0) - UNIX_EPOCH_JD) * 86400))
+        rows.append(row)
+
+    with open(path, "w") as f:
+        f.write('{"first_year": %d, "starts": [\n' % first_year)
+        f.write(",\n".join(json.dumps(row) for row in rows))
+        f.write("\n]}\n")
+
+
+class SolarTermIndex:
+    """Sorted start timestamps of every solar term in a range of years,
+    so the current term is a single bisect"""
+
+    def __init__(self, first_year, last_year, table_path=DEFAULT_TABLE):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.starts = []
+        self._table = load_table(table_path)
+        self._lock = threading.Lock()
+        self._build(first_year, last_year)
+
+    def _year_starts(self, year):
+        row = self._table.get(year)
+        if row is not None:
+            return row
+        return [solar_term_time(year, i) for i in range(24)]
+
+    def _build(self, first_year, last_year):
+        starts = []
+        for year in range(first_year, last_year + 1):
+            starts.extend(self._year_starts(year))
+        self.starts = starts
+        self.first_year = first_year
+        self.last_year = last_year
+
+    def term_at(self, timestamp):
+        """Index (0-23) of the solar term in effect at the given Unix timestamp"""
+        starts = self.starts
+        if not starts[0] <= timestamp < starts[-1]:
+            self._extend(datetime.fromtimestamp(timestamp, timezone.utc).year)
+            starts = self.starts
+        # entries are laid out year by year, 24 terms each, starting at term 0
+        return (bisect_right(starts, timestamp) - 1) % 24
+
+    def next_start(self, timestamp):
+        """Unix timestamp at which the term following the one at `timestamp` begins"""
+        starts = self.starts
+        if not starts[0] <= timestamp < starts[-1]:
+            self._extend(datetime.fromtimestamp(timestamp, timezone.utc).year)
+            starts = self.starts
+        return starts[bisect_right(starts, timestamp)]
+
+    def term_start(self, year, index):
+        """Unix timestamp of the start of a term, computed directly if out of range"""
+        if self.first_year <= year <= self.last_year:
+            return self.starts[(year - self.first_year) * 24 + index]
+        return self._year_starts(year)[index]
+
+    def _extend(self, year):
+        # rare: a lookup outside the precomputed window grows it to cover the year
+        with self._lock:
+            first_year = min(self.first_year, year - 1)
+            last_year = max(self.last_year, year + 1)
+            if (first_year, last_year) != (self.first_year, self.last_year):
+                self._build(first_year, last_year)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("usage: python solar_terms.py FIRST_YEAR LAST_YEAR")
+        sys.exit(1)
+    generate_table(int(sys.argv[1]), int(sys.argv[2]))
+    print(f"Wrote {DEFAULT_TABLE}")
@@ -0,0 +1,191 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_MESSAGE = 4096
+
+
+def retry_after(error):
+    """Seconds Telegram asked us to wait (HTTP 429), or None for other errors"""
+    result = getattr(error, "result_json", None) or {}
+    if getattr(error, "error_code", None) == 429 or result.get("error_code") == 429:
+        return float(result.get("parameters", {}).get("retry_after", 1))
+    return None
+
+
+def permanent_error(error):
+    """True for 4xx answers other than 429 (bad Markdown, bot blocked...), which retrying cannot fix"""
+    result = getattr(error, "result_json", None) or {}
+    code = getattr(error, "error_code", None) or result.get("error_code")
+    return isinstance(code, int) and 400 <= code < 500 and code != 429
+
+
+def split_lines(text, limit=TELEGRAM_MAX_MESSAGE):
+    """Split a text that is too long for one message at line boundaries.
+
+    Cutting at a character count can leave an unclosed ` or ** behind, which
+    makes Telegram reject the whole message. A single line longer than the
+    limit loses its Markdown markers before it is cut.
+    """
+    if len(text) <= limit:
+        return [text]
+    parts, current = [], ""
+    for line in text.split("\n"):
+        if len(line) > limit:
+            line = line.replace("`", "").replace("*", "")[:limit]
+        if current and len(current) + 1 + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def pack(texts, limit=TELEGRAM_MAX_MESSAGE):
+    """Join queued alerts into as few messages as fit within Telegram's length limit.
+    Returns (message, indices of the texts with a part in it) pairs."""
+    messages, current, members = [], "", []
+    for index, text in enumerate(texts):
+        for part in split_lines(text, limit):
+            if current and len(current) + 2 + len(part) > limit:
+                messages.append((current, members))
+                current, members = "", []
+            current = f"{current}\n\n{part}" if current else part
+            if not members or members[-1] != index:
+                members.append(index)
+    if current:
+        messages.append((current, members))
+    return messages
+
+
+class AlertDispatcher:
+    """Delivers alerts to users from a pool of worker threads.
+
+    submit() only appends to a per-user list and returns, so the caller (the
+    MQTT network thread) never waits on Telegram. A user is handled by one
+    worker at a time; whatever piled up for them meanwhile is sent as one
+    batch. Rate limit answers are waited out as Telegram asks, other 4xx
+    answers are given up on at once and the rest are retried with
+    exponential backoff. At most `max_queued` alerts wait;
+    beyond that new ones are dropped and counted.
+    """
+
+    def __init__(self, send, workers=2, max_queued=1000, max_retries=5, backoff=1.0, max_backoff=30.0):
+        self.send = send  # send(user_id, text), raises on failure
+        self.max_queued = max_queued
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.submitted = 0
+        self.delivered = 0
+        self.batched = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self._queued = 0
+        self._pending = {}     # user_id -> [(submitted_at, text), ...]
+        self._active = set()   # users a worker is currently sending to
+        self._ready = queue.Queue()
+        self._latencies = deque(maxlen=512)
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"alert-worker-{i}", daemon=True).start()
+
+    def submit(self, user_ids, text):
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                if self._queued >= self.max_queued:
+                    self.dropped += 1
+                    continue
+                self._queued += 1
+                self.submitted += 1
+                batch = self._pending.setdefault(user_id, [])
+                batch.append((now, text))
+                if len(batch) == 1 and user_id not in self._active:
+                    self._ready.put(user_id)
+
+    def _work(self):
+        while True:
+            user_id = self._ready.get()
+            with self._lock:
+                batch = self._pending.pop(user_id, [])
+                self._queued -= len(batch)
+                self._active.add(user_id)
+            try:
+                if batch:
+                    self._deliver(user_id, batch)
+            finally:
+                with self._lock:
+                    self._active.discard(user_id)
+                    if user_id in self._pending:
+                        self._ready.put(user_id)
+
+    def _deliver(self, user_id, batch):
+        if len(batch) > 1:
+            self.batched += len(batch) - 1
+        messages = pack([text for _, text in batch])
+        # an alert counts as delivered once the last message holding a part of it went out
+        last_message = {}
+        for position, (_, members) in enumerate(messages):
+            for index in members:
+                last_message[index] = position
+        delivered = 0
+        for position, (message, _) in enumerate(messages):
+            if not self._send_with_retry(user_id, message):
+                break
+            now = time.monotonic()
+            done = [batch[index] for index, last in last_message.items() if last == position]
+            delivered += len(done)
+            with self._lock:
+                self.delivered += len(done)
+                self._latencies.extend(now - submitted_at for submitted_at, _ in done)
+        with self._lock:
+            self.failed += len(batch) - delivered
+
+    def _send_with_retry(self, user_id, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send(user_id, message)
+                return True
+            except Exception as e:
+                if permanent_error(e):
+                    logger.error(f"Telegram rejected alert for {user_id}, not retrying: {e}")
+                    return False
+                wait = retry_after(e)
+                if wait is not None:
+                    self.rate_limited += 1
+                    logger.warning(f"Telegram rate limit for {user_id}, waiting {wait:g}s")
+                else:
+                    wait = min(self.backoff * 2 ** attempt, self.max_backoff)
+                    logger.warning(f"Failed to send alert to {user_id} (attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(wait)
+        logger.error(f"Giving up on alert for {user_id} after {self.max_retries + 1} attempts")
+        return False
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            queued = self._queued
+
+        def pick(pct):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * pct))] if latencies else 0.0
+
+        return {
+            "queued": queued,
+            "submitted": self.submitted,
+            "delivered": self.delivered,
+            "batched": self.batched,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rate_limited": self.rate_limited,
+            "latency_p50": pick(0.5),
+            "latency_p95": pick(0.95),
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
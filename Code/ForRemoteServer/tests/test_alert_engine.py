@@ -0,0 +1,97 @@
+"""AlertEngine driven by synthetic sensor streams, using the now= hook"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_engine import CLEARED, ONGOING, RAISED, AlertEngine
+
+
+def stream(engine, device_id, alarms, start=0.0, period=5.0):
+    """Feed one message per `period` seconds; returns the kinds of the events caused"""
+    events = []
+    for i, alarm in enumerate(alarms):
+        event = engine.observe(device_id, alarm, {"alarm": alarm}, now=start + i * period)
+        if event is not None:
+            events.append(event.kind)
+    return events
+
+
+def test_raise_needs_consecutive_alarms():
+    engine = AlertEngine(raise_after=3, clear_after=3)
+    assert stream(engine, "kitchen", [True, True, False, True, True]) == []
+    assert stream(engine, "kitchen", [True], start=30) == [RAISED]
+
+
+def test_flicker_does_not_clear():
+    engine = AlertEngine(raise_after=1, clear_after=3, renotify_interval=3600)
+    # a sensor bouncing around its threshold raises once and stays raised
+    assert stream(engine, "kitchen", [True, False, True, False, False, True, False, False]) == [RAISED]
+    assert engine.active() == ["kitchen"]
+
+
+def test_clear_after_quiet_streak():
+    engine = AlertEngine(raise_after=1, clear_after=3, renotify_interval=3600)
+    assert stream(engine, "kitchen", [True, True, False, False, False, False]) == [RAISED, CLEARED]
+    assert engine.active() == []
+
+
+def test_cleared_event_carries_raise_time():
+    engine = AlertEngine(raise_after=1, clear_after=2)
+    engine.observe("kitchen", True, now=100.0)
+    engine.observe("kitchen", False, now=105.0)
+    event = engine.observe("kitchen", False, now=110.0)
+    assert event.kind == CLEARED
+    assert event.since == 100.0
+    assert event.time == 110.0
+
+
+def test_renotify_interval():
+    engine = AlertEngine(raise_after=1, renotify_interval=60)
+    # alarming for 3 minutes at one message per 5 seconds
+    events = stream(engine, "kitchen", [True] * 37)
+    assert events == [RAISED, ONGOING, ONGOING, ONGOING]
+
+
+def test_renotify_not_reset_by_short_quiet_spell():
+    engine = AlertEngine(raise_after=1, clear_after=3, renotify_interval=60)
+    events = stream(engine, "kitchen", [True] * 6 + [False, False] + [True] * 6)
+    assert events == [RAISED, ONGOING]
+
+
+def test_devices_are_independent():
+    engine = AlertEngine(raise_after=2, clear_after=2)
+    assert stream(engine, "kitchen", [True]) == []
+    assert stream(engine, "garage", [True]) == []
+    assert stream(engine, "kitchen", [True], start=5) == [RAISED]
+    assert engine.active() == ["kitchen"]
+
+
+def test_digest_groups_events_within_window():
+    engine = AlertEngine(raise_after=1, digest_window=2.0)
+    for i in range(50):
+        engine.observe(f"device-{i}", True, now=100.0 + i * 0.01)
+    assert engine.due(now=101.0) == []
+    events = engine.due(now=102.0)
+    assert len(events) == 50
+    assert {event.kind for event in events} == {RAISED}
+    assert engine.due(now=103.0) == []
+
+
+def test_digest_window_starts_at_first_event():
+    engine = AlertEngine(raise_after=1, digest_window=2.0)
+    engine.observe("kitchen", True, now=100.0)
+    engine.observe("garage", True, now=101.5)
+    assert [event.device_id for event in engine.due(now=102.0)] == ["kitchen", "garage"]
+    # the next event opens a new window
+    engine.observe("attic", True, now=103.0)
+    assert engine.due(now=104.0) == []
+    assert [event.device_id for event in engine.due(now=105.0)] == ["attic"]
+
+
+def test_forget_drops_state():
+    engine = AlertEngine(raise_after=1)
+    engine.observe("kitchen", True, now=0.0)
+    engine.forget("kitchen")
+    assert engine.active() == []
+    assert engine.observe("kitchen", True, now=10.0).kind == RAISED
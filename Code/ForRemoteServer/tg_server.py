@@ -1,10 +1,20 @@
 import os
 import threading
 import json
+import math
 import time
 import telebot
 import paho.mqtt.client as mqtt
+from concurrent.futures import ThreadPoolExecutor
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from mqtt_publisher import MqttPublisher
+from telegram_alerts import TELEGRAM_MAX_MESSAGE, AlertDispatcher
+from alert_engine import CLEARED, ONGOING, RAISED, AlertEngine
+from device_registry import DeviceRegistry
+from sensor_history import SensorHistory, to_number
+from fire_detector import FireDetector
+from sensor_store import SensorStore
+from control_requests import REPLY_FIELD, RequestTracker
 
 # ====================== Configuration Section (Using your credentials) ======================
 BOT_TOKEN = {YOUR_BOT_TOKEN_HERE}  # Your provided Bot Token
@@ -22,6 +32,51 @@ MQTT_WRITE_PASS = {MQTT_WRITE_PASSWORD}
 # MQTT Topic Settings
 SENSOR_DATA_TOPIC = {TOPIC_NAME_FOR_SENSOR_TOPIC}
 CONTROL_COMMAND_TOPIC = {TOPIC_NAME_FOR_CONTROL_COMMAND_TOPIC}
+CONTROL_COMMAND_TIMEOUT = 5  # seconds to wait for the broker to acknowledge a command
+# /update waits for a device to answer with a sensor message. With
+# CONTROL_TAGGED_COMMANDS = True the command is sent as {"command": "UPDATE", "request_id": ...}
+# and only the sensor message that copies request_id back counts as the answer.
+# Set it to False for firmware that only understands the plain "UPDATE"; the next
+# sensor message from any device after the broker has the command is shown instead,
+# which says nothing about how long the device took.
+CONTROL_TAGGED_COMMANDS = True
+CONTROL_REPLY_TIMEOUT = 5    # seconds to wait for that answer
+CONTROL_MAX_IN_FLIGHT = 100
+
+# Alert delivery runs on its own threads so the MQTT loop never waits on Telegram
+ALERT_WORKERS = 2
+ALERT_QUEUE_SIZE = 1000      # alerts waiting beyond this are dropped
+ALERT_MAX_RETRIES = 5
+# An alarm is raised after ALERT_RAISE_AFTER alarming messages in a row and cleared
+# after ALERT_CLEAR_AFTER quiet ones; while it lasts it is repeated every
+# ALERT_RENOTIFY_INTERVAL seconds. Alarms within ALERT_DIGEST_WINDOW seconds are sent together.
+ALERT_RAISE_AFTER = 1
+ALERT_CLEAR_AFTER = 3
+ALERT_RENOTIFY_INTERVAL = 10 * 60
+ALERT_DIGEST_WINDOW = 2
+
+# Devices silent for this long are dropped from the registry
+DEVICE_TTL = 24 * 3600
+MAX_DEVICES = 10000
+# /history window when none is given, in seconds
+HISTORY_DEFAULT_WINDOW = 3600
+# devices with history kept (~22 KB each), least recently reporting dropped first
+HISTORY_MAX_DEVICES = 2000
+# /status and /devices list this many devices per page, with Prev/Next buttons
+DEVICES_PAGE_SIZE = 20
+# "/devices silent" without a number lists devices not seen for this many minutes
+DEVICES_SILENT_MINUTES = 10
+
+# Server-side rate-of-rise detection; a flagged device alarms even if its own threshold hasn't tripped
+FIRE_DETECTOR_INTERVAL = 1          # seconds between evaluation passes over all devices
+FIRE_TEMP_RATE_RAISE = 8.0          # ℃/min
+FIRE_TEMP_RAISE = 57.0              # ℃
+FIRE_SMOKE_RATE_RAISE = 5.0         # %/min
+
+# Every sensor message is appended to this SQLite file by a background writer
+SENSOR_DB_PATH = "sensor_readings.db"
+SENSOR_DB_RETENTION = 30 * 86400    # seconds of readings to keep
+SENSOR_DB_FLUSH_INTERVAL = 0.5      # seconds between group commits
 
 # ====================== System Status Initialization ======================
 bot = telebot.TeleBot(BOT_TOKEN)
@@ -30,10 +85,27 @@ system_status = {
     "temperature": "N/A",
     "smoke": "N/A",
     "alarm": False,
-    "devices": {},
     "notifications_enabled": True
 }
 
+def forget_device(device_id):
+    alert_engine.forget(device_id)
+    sensor_history.forget(device_id)
+    fire_detector.forget(device_id)
+
+# per-device state, written only by the MQTT thread
+device_registry = DeviceRegistry(ttl=DEVICE_TTL, max_devices=MAX_DEVICES, on_evict=forget_device)
+# fixed-size temperature/smoke history per device (10 s, 5 minute and hourly buckets)
+sensor_history = SensorHistory(max_devices=HISTORY_MAX_DEVICES)
+# per-device smoothed temperature/smoke and their rate of rise
+fire_detector = FireDetector(
+    temp_rate_raise=FIRE_TEMP_RATE_RAISE, temp_raise=FIRE_TEMP_RAISE, smoke_rate_raise=FIRE_SMOKE_RATE_RAISE)
+# durable log of all readings, opened in main; appends never block the MQTT thread
+sensor_store = None
+
+def format_reading(value):
+    return "N/A" if value is None else value
+
 # ====================== MQTT Connection Handling ======================
 def on_mqtt_connect(client, userdata, flags, rc):
     if rc == 0:
@@ -44,17 +116,28 @@ def on_mqtt_connect(client, userdata, flags, rc):
 
 def on_mqtt_message(client, userdata, msg):
     try:
-        payload = json.loads(msg.payload.decode())
+        raw = msg.payload.decode()
+        payload = json.loads(raw)
         
         device_id = payload.get("device_id", "unknown")
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        now = time.time()
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        
+        if sensor_store is not None:
+            sensor_store.append(device_id, to_number(payload.get("temperature")),
+                                to_number(payload.get("smoke")), payload.get("alarm", False), raw, now)
         
         # Update device status
-        system_status["devices"][device_id] = {
-            "temp": payload.get("temperature", "N/A"),
-            "smoke": payload.get("smoke", "N/A"),
-            "last_seen": current_time
-        }
+        device_registry.update(
+            device_id,
+            temperature=payload.get("temperature"),
+            smoke=payload.get("smoke"),
+            alarm=payload.get("alarm", False),
+            now=now,
+        )
+        sensor_history.add(device_id, payload, now)
+        fire_detector.ingest(device_id, now, to_number(payload.get("temperature")),
+                             to_number(payload.get("smoke")))
         
         # Update system status
         system_status.update({
@@ -63,43 +146,159 @@ def on_mqtt_message(client, userdata, msg):
             "smoke": payload.get("smoke", "N/A"),
             "alarm": payload.get("alarm", False)
         })
+        # answers to /update are resolved once the state above includes them
+        control_requests.resolve(payload)
         
-        # Send alert notification
-        if system_status["alarm"] and system_status["notifications_enabled"]:
-            alert_msg = (
-                "🚨 **Fire Alarm Triggered!** 🚨\n\n"
-                f"▸ Device: `{device_id}`\n"
-                f"▸ Temperature: `{payload.get('temperature', 'N/A')}℃`\n"
-                f"▸ Smoke: `{payload.get('smoke', 'N/A')}%`\n"
-                f"▸ Time: `{current_time}`"
-            )
-            send_telegram_alert(alert_msg)
+        # Only state changes become alerts; they are sent by the digest thread
+        alarm = payload.get("alarm", False)
+        reading = payload
+        if fire_detector.is_flagged(device_id):
+            alarm = True
+            reading = dict(payload, trend=fire_detector.status(device_id))
+        alert_engine.observe(device_id, alarm, reading)
             
     except Exception as e:
         print(f"[ERROR] Error processing MQTT message: {e}")
 
+def deliver_alert(user_id, message):
+    bot.send_message(user_id, message, parse_mode="Markdown")
+
+alert_dispatcher = AlertDispatcher(
+    deliver_alert, workers=ALERT_WORKERS, max_queued=ALERT_QUEUE_SIZE, max_retries=ALERT_MAX_RETRIES)
+
 def send_telegram_alert(message):
-    """Send alerts to all authorized users"""
-    for user_id in AUTHORIZED_USERS:
+    """Queue an alert for all authorized users; delivery happens on the alert workers"""
+    alert_dispatcher.submit(AUTHORIZED_USERS, message)
+
+# ====================== Alert Debouncing ======================
+alert_engine = AlertEngine(
+    raise_after=ALERT_RAISE_AFTER, clear_after=ALERT_CLEAR_AFTER,
+    renotify_interval=ALERT_RENOTIFY_INTERVAL, digest_window=ALERT_DIGEST_WINDOW)
+
+def format_event_line(event):
+    """One line per device for the digest"""
+    reading = event.reading or {}
+    label = {RAISED: "🚨 Alarm", ONGOING: "🔥 Still alarming", CLEARED: "✅ Cleared"}[event.kind]
+    return (f"{label}: `{event.device_id}` | {reading.get('temperature', 'N/A')}℃ | "
+            f"{reading.get('smoke', 'N/A')}% | since {time.strftime('%H:%M:%S', time.localtime(event.since))}")
+
+def format_trend(trend):
+    """Extra alert line when the server-side detector raised the alarm"""
+    if trend is None:
+        return ""
+    return f"▸ Rising: `{trend.temperature_rate:+.1f}℃/min, smoke {trend.smoke_rate:+.1f}%/min`\n"
+
+def format_alert(events):
+    """Build the Telegram message for the events of one digest window"""
+    if len(events) == 1:
+        event = events[0]
+        reading = event.reading or {}
+        title = {
+            RAISED: "🚨 **Fire Alarm Triggered!** 🚨",
+            ONGOING: "🔥 **Fire Alarm Still Active** 🔥",
+            CLEARED: "✅ **Fire Alarm Cleared**",
+        }[event.kind]
+        return (
+            f"{title}\n\n"
+            f"▸ Device: `{event.device_id}`\n"
+            f"▸ Temperature: `{reading.get('temperature', 'N/A')}℃`\n"
+            f"▸ Smoke: `{reading.get('smoke', 'N/A')}%`\n"
+            f"{format_trend(reading.get('trend'))}"
+            f"▸ Time: `{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.time))}`"
+        )
+    raised = sum(1 for event in events if event.kind != CLEARED)
+    lines = [f"🚨 **Fire Alarm Digest: {raised} alarming, {len(events) - raised} cleared** 🚨", ""]
+    lines.extend(format_event_line(event) for event in events)
+    return "\n".join(lines)
+
+def alert_digest_loop():
+    """Send what the alert engine collected once each digest window closes"""
+    while True:
+        time.sleep(ALERT_DIGEST_WINDOW / 2)
+        try:
+            events = alert_engine.due()
+            if events and system_status["notifications_enabled"]:
+                send_telegram_alert(format_alert(events))
+        except Exception as e:
+            print(f"[ERROR] Error sending alert digest: {e}")
+
+threading.Thread(target=alert_digest_loop, daemon=True).start()
+
+def fire_detector_loop():
+    """Evaluate every device's trend in one pass per FIRE_DETECTOR_INTERVAL"""
+    while True:
+        time.sleep(FIRE_DETECTOR_INTERVAL)
         try:
-            bot.send_message(user_id, message, parse_mode="Markdown")
+            for detection in fire_detector.evaluate():
+                state = "flagged" if detection.flagged else "cleared"
+                print(f"[DETECTOR] {detection.device_id} {state}: {detection.temperature:.1f}℃ "
+                      f"({detection.temperature_rate:+.1f}/min), smoke {detection.smoke:.1f}% "
+                      f"({detection.smoke_rate:+.1f}/min)")
         except Exception as e:
-            print(f"[ERROR] Failed to send message to user {user_id}: {e}")
+            print(f"[ERROR] Fire detector pass failed: {e}")
+
+threading.Thread(target=fire_detector_loop, daemon=True).start()
 
 # ====================== MQTT Control Command Sending ======================
-def send_control_command(command):
-    """Send control commands to ESP32 via MQTT"""
+# one authenticated write connection for the lifetime of the bot, created in main;
+# commands sent while it is reconnecting are queued until CONTROL_COMMAND_TIMEOUT
+control_publisher = None
+# commands waiting for a device's answer on the sensor topic, any number at once
+control_requests = RequestTracker(
+    timeout=CONTROL_REPLY_TIMEOUT, max_pending=CONTROL_MAX_IN_FLIGHT,
+    accept_untagged=not CONTROL_TAGGED_COMMANDS)
+# answers are reported from here, never from the MQTT thread that resolved them
+control_reply_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="control-reply")
+
+def send_control_command(command, request_id=None):
+    """Send control commands to ESP32 via MQTT and wait for the broker's PUBACK"""
+    payload = command if request_id is None else json.dumps({"command": command, REPLY_FIELD: request_id})
     try:
-        ctrl_client = mqtt.Client()
-        ctrl_client.username_pw_set(MQTT_WRITE_USER, MQTT_WRITE_PASS)
-        ctrl_client.connect(MQTT_BROKER, MQTT_PORT)
-        ctrl_client.publish(CONTROL_COMMAND_TOPIC, command, qos=1)
-        ctrl_client.disconnect()
+        future = control_publisher.publish(
+            CONTROL_COMMAND_TOPIC, payload, qos=1, timeout=CONTROL_COMMAND_TIMEOUT)
+        rtt = future.result(timeout=CONTROL_COMMAND_TIMEOUT)
+        print(f"[MQTT] Command {command} acknowledged in {rtt * 1000:.0f} ms")
         return True
     except Exception as e:
-        print(f"[ERROR] Failed to send control command: {e}")
+        print(f"[ERROR] Failed to send control command: {e or type(e).__name__}")
         return False
 
+def request_update(chat_id):
+    """Send UPDATE and wait for the answer without blocking; the status follows once a device answers"""
+    if CONTROL_TAGGED_COMMANDS:
+        request_id, reply = control_requests.open("UPDATE")
+        if not send_control_command("UPDATE", request_id):
+            control_requests.cancel(request_id)
+            return False
+    else:
+        # any sensor message answers a plain UPDATE, so only start listening once
+        # the broker has it; earlier ones cannot be a reaction to the command
+        if not send_control_command("UPDATE"):
+            return False
+        _, reply = control_requests.open("UPDATE")
+    reply.add_done_callback(lambda future: control_reply_pool.submit(report_update, chat_id, future))
+    return True
+
+def report_update(chat_id, future):
+    """Send the refreshed status, with the measured round trip or why there is none"""
+    try:
+        rtt, reply = future.result()
+        device = reply.get('device_id', 'unknown')
+        if CONTROL_TAGGED_COMMANDS:
+            note = f"Device `{device}` answered in {rtt * 1000:.0f} ms"
+        else:
+            note = f"Next message after the command came from `{device}` ({rtt * 1000:.0f} ms later)"
+    except TimeoutError:
+        note = f"No device answered within {CONTROL_REPLY_TIMEOUT}s, showing last known status"
+    except Exception as e:
+        note = f"Update failed: {e}"
+    try:
+        status_msg, keyboard = build_status_message()
+        bot.send_message(chat_id, fit_message(f"{note}\n\n{status_msg}"),
+                         parse_mode="Markdown", reply_markup=keyboard)
+    except Exception as e:
+        print(f"[ERROR] Error reporting update: {e}")
+
 # ====================== Telegram Bot Functions ======================
 def auth_required(func):
     """Authorization check decorator"""
@@ -120,10 +319,11 @@ def send_welcome(message):
     welcome_msg = (
         "Fire Monitoring System Control Center\n\n"
         "Available commands:\n"
-        "/status - View current system status\n"
+        "/status [alarm|silent <min>] - View current system status\n"
         "/update - Manually update system information\n"
         "/toggle\_alerts - Toggle alert notification status\n"
-        "/devices - Show connected devices list\n"
+        "/devices [alarm|silent <min>] - Show connected devices list\n"
+        "/history <device> [30m|6h|2d] - Temperature and smoke summary\n"
         "/system\_info - Display system configuration information\n"
         "/test\_alarm - Send test alarm\n\n"
         "System permissions verified"
@@ -145,13 +345,16 @@ def send_welcome(message):
 @auth_required
 def cmd_status(message):
     """System status command"""
-    status_msg = build_status_message()
-    bot.send_message(message.chat.id, status_msg, parse_mode="Markdown")
+    device_filter = parse_device_filter(message.text.split()[1:])
+    if device_filter is None:
+        bot.reply_to(message, "Usage: /status [alarm | silent <minutes>]")
+        return
+    status_msg, keyboard = build_status_message(device_filter)
+    bot.send_message(message.chat.id, status_msg, parse_mode="Markdown", reply_markup=keyboard)
 
-def build_status_message():
-    """Build system status message"""
+def build_status_message(device_filter="all", page=0):
+    """Build system status message and the keyboard for its device pages"""
     status = system_status
-    devices = status["devices"]
     
     status_msg = (
         "System Status Overview\n\n"
@@ -162,22 +365,18 @@ def build_status_message():
         f"▸ Notification status: `{'Enabled' if status['notifications_enabled'] else 'Disabled'}`"
     )
     
-    if devices:
-        status_msg += "\n\n**📡 Connected Devices:**"
-        for device_id, data in devices.items():
-            status_msg += f"\n├─ `{device_id}` | {data['temp']}℃ | {data['smoke']}%"
+    body, keyboard = device_page("status", device_filter, page)
+    if body:
+        status_msg = fit_message(status_msg + "\n\n" + body)
     
-    return status_msg
+    return status_msg, keyboard
 
 @bot.message_handler(commands=['update'])
 @auth_required
 def cmd_alarm_off(message):
-    if send_control_command("UPDATE"):
+    # the status is sent by report_update once a device answers or the wait times out
+    if request_update(message.chat.id):
         bot.reply_to(message, "System update command sent")
-        # Refresh latest status
-        time.sleep(1)  # Wait for update to complete
-        status_msg = build_status_message()
-        bot.send_message(message.chat.id, status_msg, parse_mode="Markdown")
     else:
         bot.reply_to(message, "Command failed to send, please check MQTT connection")
 
@@ -193,29 +392,191 @@ def cmd_toggle_alerts(message):
 @auth_required
 def cmd_devices(message):
     """Show devices list"""
-    devices = system_status["devices"]
+    device_filter = parse_device_filter(message.text.split()[1:])
+    if device_filter is None:
+        bot.reply_to(message, "Usage: /devices [alarm | silent <minutes>]")
+        return
     
-    if not devices:
+    devices_msg, keyboard = device_page("devices", device_filter, 0)
+    if not devices_msg:
         bot.reply_to(message, "No connected devices detected")
         return
     
-    devices_msg = "Registered Devices List\n\n"
-    for idx, (device_id, data) in enumerate(devices.items(), 1):
-        devices_msg += f"{idx}. `{device_id}`\n▸ Temperature: {data['temp']}℃\n▸ Smoke: {data['smoke']}%\n"
+    bot.send_message(message.chat.id, devices_msg, parse_mode="Markdown", reply_markup=keyboard)
+
+# ====================== Paged Device Lists ======================
+# (view, filter, page) -> (cache key, text, keyboard); a page is only rebuilt
+# after the registry changed, or for the silent filter once a minute has passed
+device_page_cache = {}
+DEVICE_PAGE_CACHE_SIZE = 256
+
+def parse_device_filter(args):
+    """'alarm' or 'silent [minutes]' to a filter name; None if not understood"""
+    if not args:
+        return "all"
+    if args[0].lower() in ("alarm", "alarming"):
+        return "alarm"
+    if args[0].lower() == "silent":
+        if len(args) == 1:
+            return f"silent{DEVICES_SILENT_MINUTES}"
+        if args[1].isdigit():
+            return f"silent{int(args[1])}"
+    return None
+
+def filtered_devices(device_filter):
+    """Records for a filter, from the registry's indexes rather than a scan of every device"""
+    if device_filter == "alarm":
+        return device_registry.alarming()
+    if device_filter.startswith("silent"):
+        return device_registry.silent(int(device_filter[len("silent"):]) * 60)
+    return device_registry.snapshot()
+
+def describe_filter(device_filter):
+    if device_filter == "alarm":
+        return "alarming"
+    if device_filter.startswith("silent"):
+        return f"silent for {device_filter[len('silent'):]}+ min"
+    return "all"
+
+def short_id(device_id, limit=64):
+    device_id = str(device_id)
+    return device_id if len(device_id) <= limit else device_id[:limit - 1] + "…"
+
+def fit_message(text, limit=TELEGRAM_MAX_MESSAGE):
+    """Cut whole lines off the end until the text fits in one Telegram message"""
+    if len(text) <= limit:
+        return text
+    return text[:limit - 2].rsplit("\n", 1)[0] + "\n…"
+
+def device_page(view, device_filter, page):
+    """Text of one page of the device list for /status or /devices and its Prev/Next keyboard"""
+    device_registry.evict_expired()
+    cache_key = device_registry.version
+    if device_filter.startswith("silent"):
+        cache_key = (cache_key, int(time.time() // 60))
+    cached = device_page_cache.get((view, device_filter, page))
+    if cached is not None and cached[0] == cache_key:
+        return cached[1], cached[2]
+    
+    devices = filtered_devices(device_filter)
+    pages = max(1, -(-len(devices) // DEVICES_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    first = page * DEVICES_PAGE_SIZE
+    shown = devices[first:first + DEVICES_PAGE_SIZE]
+    
+    if view == "status":
+        lines = ["**📡 Connected Devices:**"] if shown else []
+        lines.extend(
+            f"├─ `{short_id(device.device_id)}` | {format_reading(device.temperature)}℃ | "
+            f"{format_reading(device.smoke)}%{' 🚨' if device.alarm else ''}"
+            for device in shown
+        )
+    else:
+        lines = ["Registered Devices List\n"] if shown else []
+        for idx, device in enumerate(shown, first + 1):
+            # to the minute, like the registry version this page is cached under
+            last_seen = time.strftime("%H:%M", time.localtime(device.last_seen))
+            lines.append(
+                f"{idx}. `{short_id(device.device_id)}`{' 🚨' if device.alarm else ''}\n"
+                f"▸ Temperature: {format_reading(device.temperature)}℃\n"
+                f"▸ Smoke: {format_reading(device.smoke)}%\n▸ Last seen: {last_seen}"
+            )
+    if device_filter != "all" and not shown:
+        lines = [f"No devices match the filter: {describe_filter(device_filter)}"]
+    elif shown and (pages > 1 or device_filter != "all"):
+        count = f"{len(devices)} device{'s' if len(devices) != 1 else ''}"
+        lines.append(f"\nPage {page + 1}/{pages} | {count} ({describe_filter(device_filter)})")
+    text = fit_message("\n".join(lines))
+    
+    keyboard = None
+    if pages > 1:
+        keyboard = InlineKeyboardMarkup()
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("◀ Prev", callback_data=f"page:{view}:{device_filter}:{page - 1}"))
+        if page < pages - 1:
+            buttons.append(InlineKeyboardButton("Next ▶", callback_data=f"page:{view}:{device_filter}:{page + 1}"))
+        keyboard.row(*buttons)
     
-    bot.send_message(message.chat.id, devices_msg, parse_mode="Markdown")
+    if len(device_page_cache) >= DEVICE_PAGE_CACHE_SIZE:
+        device_page_cache.clear()
+    device_page_cache[(view, device_filter, page)] = (cache_key, text, keyboard)
+    return text, keyboard
+
+def parse_window(text):
+    """'90s', '30m', '6h' or '2d' to seconds; ValueError unless finite and positive"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text[-1:].lower() in units:
+        seconds = float(text[:-1]) * units[text[-1].lower()]
+    else:
+        seconds = float(text)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"bad window {text!r}")
+    return seconds
+
+def format_window(seconds):
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{int(seconds)}s"
+
+@bot.message_handler(commands=['history'])
+@auth_required
+def cmd_history(message):
+    """Min/max/mean of a device's readings over a time window"""
+    args = message.text.split()[1:]
+    if not args:
+        bot.reply_to(message, "Usage: /history <device> [30m|6h|2d]")
+        return
+    device_id = args[0]
+    try:
+        window = parse_window(args[1]) if len(args) > 1 else HISTORY_DEFAULT_WINDOW
+    except ValueError:
+        bot.reply_to(message, "Window must look like 90s, 30m, 6h or 2d")
+        return
+    window = min(max(window, 1), sensor_history.max_window())
+    
+    summary = sensor_history.summary(device_id, window)
+    if summary is None:
+        bot.reply_to(message, f"No history for device `{device_id}`", parse_mode="Markdown")
+        return
+    
+    lines = [f"History of `{device_id}` over the last {format_window(window)}", ""]
+    for channel, unit in (("temperature", "℃"), ("smoke", "%")):
+        stats = summary[channel]
+        if not stats.count:
+            lines.append(f"▸ {channel.capitalize()}: no samples")
+            continue
+        lines.append(
+            f"▸ {channel.capitalize()}: min `{stats.min:.1f}{unit}` | max `{stats.max:.1f}{unit}` | "
+            f"mean `{stats.mean:.1f}{unit}` ({stats.count} samples, {format_window(stats.resolution)} buckets)"
+        )
+    bot.send_message(message.chat.id, "\n".join(lines), parse_mode="Markdown")
 
 @bot.message_handler(commands=['system_info'])
 @auth_required
 def cmd_system_info(message):
     """System information command"""
+    alerts = alert_dispatcher.stats()
+    replies = control_requests.stats()
+    if sensor_store is not None:
+        store = sensor_store.stats()
+        stored = f"{store['written']} written, {store['queued']} queued, {store['dropped']} dropped"
+    else:
+        stored = "disabled"
     info_msg = (
         "System Configuration Information\n\n"
         f"▸ User ID: `{AUTHORIZED_USERS[0]}`\n"
         f"▸ MQTT Server: `{MQTT_BROKER}:{MQTT_PORT}`\n"
         f"▸ Data Topic: `{SENSOR_DATA_TOPIC}`\n"
         f"▸ Control Topic: `{CONTROL_COMMAND_TOPIC}`\n"
-        f"▸ Device Count: `{len(system_status['devices'])}`\n\n"
+        f"▸ Device Count: `{len(device_registry)}`\n"
+        f"▸ Alert Queue: `{alerts['queued']} waiting, {alerts['delivered']} sent, "
+        f"{alerts['failed'] + alerts['dropped']} lost`\n"
+        f"▸ Alert Latency: `p50 {alerts['latency_p50']:.1f}s / p95 {alerts['latency_p95']:.1f}s`\n"
+        f"▸ Stored Readings: `{stored}`\n"
+        f"▸ Command Replies: `{replies['completed']} answered, {replies['timeouts']} timed out, "
+        f"{replies['pending']} waiting, RTT p50 {replies['rtt_p50'] * 1000:.0f} ms`\n\n"
         "Permission Information\n"
         f"▸ Data Read Account: `{MQTT_READ_USER}`\n"
         f"▸ Control Command Account: `{MQTT_WRITE_USER}`"
@@ -237,19 +598,47 @@ def cmd_test_alarm(message):
 def handle_callback(call):
     try:
         if call.data == "status":
-            status_msg = build_status_message()
+            status_msg, keyboard = build_status_message()
             bot.edit_message_text(
                 chat_id=call.message.chat.id,
                 message_id=call.message.message_id,
                 text=status_msg,
-                parse_mode="Markdown"
+                parse_mode="Markdown",
+                reply_markup=keyboard
             )
+        elif call.data.startswith("page:"):
+            if call.from_user.id not in AUTHORIZED_USERS:
+                bot.answer_callback_query(call.id, "Unauthorized")
+                return
+            _, view, device_filter, page = call.data.split(":")
+            if view == "status":
+                text, keyboard = build_status_message(device_filter, int(page))
+            else:
+                text, keyboard = device_page(view, device_filter, int(page))
+            bot.edit_message_text(
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=text or "No connected devices detected",
+                parse_mode="Markdown",
+                reply_markup=keyboard
+            )
+            bot.answer_callback_query(call.id)
         elif call.data == "devices":
+            if call.from_user.id not in AUTHORIZED_USERS:
+                bot.answer_callback_query(call.id, "Unauthorized")
+                return
             bot.answer_callback_query(call.id, "Loading device list...")
-            cmd_devices(call.message)
+            devices_msg, keyboard = device_page("devices", "all", 0)
+            bot.send_message(call.message.chat.id, devices_msg or "No connected devices detected",
+                             parse_mode="Markdown", reply_markup=keyboard)
         elif call.data == "update":
-            cmd_update(call.message)
-            bot.answer_callback_query(call.id, "Updating system status...")
+            if call.from_user.id not in AUTHORIZED_USERS:
+                bot.answer_callback_query(call.id, "Unauthorized")
+                return
+            if request_update(call.message.chat.id):
+                bot.answer_callback_query(call.id, "Updating system status...")
+            else:
+                bot.answer_callback_query(call.id, "Command failed to send")
         elif call.data == "system_info":
             cmd_system_info(call.message)
             bot.answer_callback_query(call.id, "Displaying system information")
@@ -265,6 +654,11 @@ if __name__ == "__main__":
     mqtt_client.on_connect = on_mqtt_connect
     mqtt_client.on_message = on_mqtt_message
     
+    control_publisher = MqttPublisher(
+        MQTT_BROKER, MQTT_PORT, MQTT_WRITE_USER, MQTT_WRITE_PASS, client_id="tg_server-control")
+    sensor_store = SensorStore(
+        SENSOR_DB_PATH, retention=SENSOR_DB_RETENTION, flush_interval=SENSOR_DB_FLUSH_INTERVAL)
+    
     # Start MQTT thread
     print("Fire monitoring system starting...")
     print(f"Authorized users: {AUTHORIZED_USERS}")
@@ -283,6 +677,8 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\nShutting down system...")
         mqtt_client.disconnect()
+        control_publisher.close()
+        sensor_store.close()
         print("System shut down")
     except Exception as e:
         print(f"[CRITICAL] System startup failed: {e}")
\ No newline at end of file
@@ -1,51 +1,176 @@
-from datetime import datetime
-from flask import Flask, jsonify, request
-from lunarcalendar import Solar, Converter
-import requests
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, g, jsonify, request
 import logging
 
-# config log system
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('weather_api.log'),
-        logging.StreamHandler()
-    ]
-)
+from server_logging import setup_logging
+from cache import TTLCache, StaleWhileRevalidateCache
+from persistent_store import PersistentStore
+from singleflight import SingleFlight
+from upstream import UpstreamError, build_clients
+from solar_terms import SolarTermIndex
+import compact_format
+from metrics import REGISTRY, Counter, Gauge, Histogram, merge_families
+from forecast_prefetcher import ForecastPrefetcher
+from lunar_table import CALENDAR_FIELDS, ZODIAC_EN, LunarCalendar, calendar_row
+
+# config log system: records go through a bounded queue and are written by a
+# background thread, so requests never wait on the disk
+LOG_FILE = 'weather_api.log'
+LOG_LEVEL = logging.INFO
+LOG_MAX_BYTES = 5 * 1024 * 1024   # rotate the log file at this size
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000            # records beyond this are dropped, not waited on
+LOG_HEADER_SAMPLE_RATE = 0.01     # fraction of requests whose full headers are logged
+
+log_handler = setup_logging(LOG_FILE, level=LOG_LEVEL, max_bytes=LOG_MAX_BYTES,
+                            backup_count=LOG_BACKUP_COUNT, queue_size=LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
-IPGEO_API_KEY = {YOUR_API_KEY_HERE}
-GOOGLE_WEATHER_API_KEY = {YOUR_API_KEY_HERE}
+# keys can also come from the environment, which is how the offline benchmarks run
+IPGEO_API_KEY = os.environ.get("IPGEO_API_KEY") or {YOUR_API_KEY_HERE}
+GOOGLE_WEATHER_API_KEY = os.environ.get("GOOGLE_WEATHER_API_KEY") or {YOUR_API_KEY_HERE}
+
+# IP geolocation cache: desk clocks sit behind a few fixed NAT addresses,
+# so one lookup per IP per TTL is enough
+GEO_CACHE_SIZE = 1024
+GEO_CACHE_TTL = 6 * 3600      # seconds a successful lookup is reused
+GEO_NEGATIVE_TTL = 5 * 60     # seconds a failed lookup is reused
+
+# Forecast cache: devices in the same grid cell share one forecast
+FORECAST_GRID = 0.1               # degrees lat/lon per cache cell (~11 km)
+FORECAST_CACHE_SIZE = 512
+FORECAST_SOFT_TTL = 30 * 60       # after this the entry is refreshed in the background
+FORECAST_MAX_AGE = 3 * 3600       # after this the entry is no longer served
+
+# Solar term start times are precomputed once for this range of years;
+# lookups outside it extend the index on demand
+SOLAR_TERM_FIRST_YEAR = datetime.now().year - 1
+SOLAR_TERM_LAST_YEAR = datetime.now().year + 10
+LUNAR_WINDOW_DAYS = 1100          # days ahead whose lunar date is precomputed and kept
+
+# /calendar range endpoint
+CALENDAR_DEFAULT_DAYS = 31
+CALENDAR_MAX_DAYS = 3 * 366
+CALENDAR_CACHE_SIZE = 64          # rendered ranges kept in memory
+CALENDAR_CACHE_TTL = 24 * 3600
+CALENDAR_VERSION = 1              # bump when the row layout changes so device ETags miss
+
+# /snapshot computes the weather part on this pool and gives up waiting for it
+# after SNAPSHOT_WEATHER_TIMEOUT, serving the cached forecast instead
+SNAPSHOT_WORKERS = 8
+SNAPSHOT_WEATHER_TIMEOUT = 3.0
+SNAPSHOT_MAX_PENDING = 32  # weather lookups running or queued; beyond that the cached forecast is served at once
+
+# Concurrent misses for the same IP / grid cell share one upstream call. A coalesced
+# request waits as long as that call can take with all its retries, plus this margin,
+# so it never gives up on a call that may still succeed
+UPSTREAM_WAIT_MARGIN = 2
+
+# Pooled keep-alive clients, one per upstream host. Point base_url at a local
+# stub server to test without touching the real APIs.
+UPSTREAMS = {
+    "ipgeo": {
+        "base_url": "https://api.ipgeolocation.io",
+        "connect_timeout": 3.0,
+        "read_timeout": 5.0,
+        "retries": 2,
+        "backoff_factor": 0.3,
+        "pool_size": 10,
+        "failure_threshold": 5,
+        "reset_timeout": 30.0,
+    },
+    "weather": {
+        "base_url": "https://weather.googleapis.com",
+        "connect_timeout": 3.0,
+        "read_timeout": 10.0,
+        "retries": 2,
+        "backoff_factor": 0.5,
+        "pool_size": 10,
+        "failure_threshold": 5,
+        "reset_timeout": 60.0,
+    },
+}
+# when an upstream is failing, cached forecasts up to this age are still served
+FORECAST_STALE_IF_ERROR = 24 * 3600
+# SQLite file backing the caches so restarts start warm; None keeps them in memory only.
+# TIME_SERVER_CACHE_PATH overrides it, an empty value meaning None.
+PERSISTENT_CACHE_PATH = os.environ.get("TIME_SERVER_CACHE_PATH", 'time_server_cache.db') or None
+PERSISTENT_CACHE_FLUSH_INTERVAL = 0.5       # seconds between write-behind commits
+PERSISTENT_CACHE_COMPACT_INTERVAL = 600     # seconds between purges of expired entries
+# with several worker processes each one publishes its metrics to the store this often
+METRICS_SHARE_INTERVAL = 5
+# forecasts of grid cells devices asked for are refreshed ahead of FORECAST_SOFT_TTL
+FORECAST_PREFETCH = True
+FORECAST_PREFETCH_LEAD_TIME = 5 * 60        # refresh this long before the entry goes stale
+FORECAST_PREFETCH_STAGGER = 2 * 60          # random spread so cells don't refresh together
+FORECAST_PREFETCH_IDLE_TIMEOUT = 3 * 86400  # forget cells nobody asked for in this long
+# prefetched forecasts are published retained to WEATHER_TOPIC_PREFIX/<lat>_<lon>;
+# None disables publishing
+WEATHER_MQTT_BROKER = None
+WEATHER_MQTT_PORT = 1883
+WEATHER_MQTT_USER = None
+WEATHER_MQTT_PASS = None
+WEATHER_TOPIC_PREFIX = 'thatclock/weather'
 
 app = Flask(__name__)
+persistent_store = PersistentStore(
+    PERSISTENT_CACHE_PATH, flush_interval=PERSISTENT_CACHE_FLUSH_INTERVAL,
+    compact_interval=PERSISTENT_CACHE_COMPACT_INTERVAL) if PERSISTENT_CACHE_PATH else None
+geo_cache = TTLCache(maxsize=GEO_CACHE_SIZE, ttl=GEO_CACHE_TTL, negative_ttl=GEO_NEGATIVE_TTL,
+                     store=persistent_store, namespace="geo")
+forecast_cache = StaleWhileRevalidateCache(
+    maxsize=FORECAST_CACHE_SIZE, soft_ttl=FORECAST_SOFT_TTL, max_age=FORECAST_MAX_AGE,
+    store=persistent_store, namespace="forecast", persist_ttl=FORECAST_STALE_IF_ERROR)
+upstreams = build_clients(UPSTREAMS)
+geo_flight = SingleFlight(timeout=upstreams['ipgeo'].worst_case_time() + UPSTREAM_WAIT_MARGIN)
+forecast_flight = SingleFlight(timeout=upstreams['weather'].worst_case_time() + UPSTREAM_WAIT_MARGIN)
+solar_term_index = SolarTermIndex(SOLAR_TERM_FIRST_YEAR, SOLAR_TERM_LAST_YEAR)
+lunar_calendar = LunarCalendar(solar_term_index, window_days=LUNAR_WINDOW_DAYS,
+                               store=persistent_store, namespace=f"lunar-v{CALENDAR_VERSION}")
+lunar_calendar.warm()
+calendar_cache = TTLCache(maxsize=CALENDAR_CACHE_SIZE, ttl=CALENDAR_CACHE_TTL,
+                          store=persistent_store, namespace="calendar")
+REQUESTS = Counter("timeserver_requests_total", "HTTP requests served", ["route", "status"])
+REQUEST_ERRORS = Counter("timeserver_request_errors_total", "HTTP requests answered with status >= 400", ["route"])
+REQUEST_LATENCY = Histogram("timeserver_request_duration_seconds", "Request latency per route", ["route"])
+IN_FLIGHT = Gauge("timeserver_requests_in_flight", "Requests currently being handled", ["route"])
+STAGE_LATENCY = Histogram("timeserver_stage_duration_seconds",
+                          "Latency of the stages behind /weather", ["stage"])
+
+snapshot_pool = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix="snapshot")
+# the pool's own queue is unbounded, so submissions are counted against SNAPSHOT_MAX_PENDING here
+snapshot_slots = threading.BoundedSemaphore(SNAPSHOT_MAX_PENDING)
+
+def submit_snapshot_weather(ip):
+    """Start build_weather(ip) on the snapshot pool; None when too many are pending already"""
+    if not snapshot_slots.acquire(blocking=False):
+        return None
+    try:
+        future = snapshot_pool.submit(build_weather, ip)
+    except BaseException:
+        snapshot_slots.release()
+        raise
+    future.add_done_callback(lambda _: snapshot_slots.release())
+    return future
+
+class LocationUnavailable(Exception):
+    """Location API answered without latitude/longitude"""
+    def __init__(self, ip, geo_data):
+        super().__init__("Unable to retrieve location")
+        self.ip = ip
+        self.geo_data = geo_data
 
-solar_terms_2025 = [
-    {"name": "Minor Cold", "date": "2025-01-05", "time": "10:33"},
-    {"name": "Major Cold", "date": "2025-01-20", "time": "04:00"},
-    {"name": "Beginning of Spring", "date": "2025-02-03", "time": "22:10"},
-    {"name": "Rain Water", "date": "2025-02-18", "time": "18:07"},
-    {"name": "Awakening of Insects", "date": "2025-03-05", "time": "16:07"},
-    {"name": "Spring Equinox", "date": "2025-03-20", "time": "17:01"},
-    {"name": "Pure Brightness", "date": "2025-04-04", "time": "20:49"},
-    {"name": "Grain Rain", "date": "2025-04-20", "time": "03:56"},
-    {"name": "Beginning of Summer", "date": "2025-05-05", "time": "13:57"},
-    {"name": "Grain Full", "date": "2025-05-21", "time": "02:55"},
-    {"name": "Grain in Ear", "date": "2025-06-05", "time": "17:57"},
-    {"name": "Summer Solstice", "date": "2025-06-21", "time": "10:42"},
-    {"name": "Minor Heat", "date": "2025-07-07", "time": "04:05"},
-    {"name": "Major Heat", "date": "2025-07-22", "time": "21:29"},
-    {"name": "Beginning of Autumn", "date": "2025-08-07", "time": "13:52"},
-    {"name": "End of Heat", "date": "2025-08-23", "time": "04:34"},
-    {"name": "White Dew", "date": "2025-09-07", "time": "16:52"},
-    {"name": "Autumn Equinox", "date": "2025-09-23", "time": "02:19"},
-    {"name": "Cold Dew", "date": "2025-10-08", "time": "08:41"},
-    {"name": "Frost's Descent", "date": "2025-10-23", "time": "11:51"},
-    {"name": "Beginning of Winter", "date": "2025-11-07", "time": "12:04"},
-    {"name": "Minor Snow", "date": "2025-11-22", "time": "09:36"},
-    {"name": "Major Snow", "date": "2025-12-07", "time": "05:05"},
-    {"name": "Winter Solstice", "date": "2025-12-21", "time": "23:03"}
-]
+class ForecastUnavailable(Exception):
+    """Weather API answered without usable forecast data"""
+    def __init__(self, weather_data):
+        super().__init__("Unable to retrieve weather data")
+        self.weather_data = weather_data
 
 weather_image_mapping = {
     "CLEAR": 3,
@@ -97,12 +222,38 @@ weather_image_mapping = {
     "FOG": 16,
 }
 
-def log_request_details():
-    logger.info(f"Received request from: {request.remote_addr}")
-    logger.info(f"Request URL: {request.url}")
-    logger.info(f"Request Headers: {dict(request.headers)}")
-    logger.info(f"Request Method: {request.method}")
-    logger.info(f"Query Parameters: {request.args}")
+def request_route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+@app.before_request
+def start_request_timer():
+    g.start_time = time.perf_counter()
+    g.route = request_route()
+    IN_FLIGHT.labels(route=g.route).inc()
+
+@app.teardown_request
+def finish_request(exc):
+    if 'route' in g:
+        IN_FLIGHT.labels(route=g.route).dec()
+
+@app.after_request
+def log_request_details(response):
+    duration = time.perf_counter() - g.get('start_time', time.perf_counter())
+    route = g.get('route') or request_route()
+    REQUESTS.labels(route=route, status=response.status_code).inc()
+    REQUEST_LATENCY.labels(route=route).observe(duration)
+    if response.status_code >= 400:
+        REQUEST_ERRORS.labels(route=route).inc()
+    
+    # one line per request; the full header dump is only sampled
+    duration_ms = duration * 1000
+    logger.info(
+        f"request ip={get_client_ip()} method={request.method} path={request.full_path.rstrip('?')} "
+        f"status={response.status_code} bytes={response.content_length or 0} ms={duration_ms:.1f}"
+    )
+    if LOG_HEADER_SAMPLE_RATE and random.random() < LOG_HEADER_SAMPLE_RATE:
+        logger.info(f"request headers: {dict(request.headers)}")
+    return response
 
 def get_client_ip():
     if 'X-Forwarded-For' in request.headers:
@@ -111,53 +262,307 @@ def get_client_ip():
         ip = request.remote_addr
     return ip.strip()
 
+def wants_binary():
+    """True if the device asked for the compact binary format"""
+    if request.args.get('fmt') == 'bin':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', compact_format.MIMETYPE])
+    return best == compact_format.MIMETYPE
+
+def binary_response(data):
+    return Response(data, mimetype=compact_format.MIMETYPE)
+
+def with_cache_headers(response, max_age, etag=None):
+    """Attach ETag, Cache-Control and Expires, and answer 304 if the device already has this body"""
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag)
+    max_age = max(0, int(max_age))
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.expires = datetime.now(timezone.utc) + timedelta(seconds=max_age)
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+def has_location(geo_data):
+    return all(key in geo_data for key in ['latitude', 'longitude'])
+
+def lookup_location(ip):
+    geo_data = geo_cache.get(ip)
+    if geo_data is not None:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Location cache hit for %s (%s)", ip, geo_cache.stats())
+        return geo_data
+    try:
+        return geo_flight.do(ip, lambda: fetch_location(ip))
+    except (UpstreamError, TimeoutError) as e:
+        geo_data = geo_cache.get_stale(ip)
+        if geo_data is None or not has_location(geo_data):
+            raise
+        logger.warning(f"Location API failing ({e}), using expired location for {ip}")
+        return geo_data
+
+def fetch_location(ip):
+    logger.debug("Requesting location for %s from: %s", ip, upstreams['ipgeo'].base_url)
+
+    with STAGE_LATENCY.labels(stage="geo_lookup").time():
+        geo_response = upstreams['ipgeo'].get("/ipgeo", params={"apiKey": IPGEO_API_KEY, "ip": ip})
+    logger.debug("Location API response status: %s", geo_response.status_code)
+
+    geo_data = geo_response.json()
+    logger.debug("Location API response: %s", geo_data)
+
+    # failed lookups are cached briefly so a bad IP does not hit the API every poll
+    if has_location(geo_data):
+        geo_cache.set(ip, geo_data)
+    else:
+        geo_cache.set_negative(ip, geo_data)
+    return geo_data
+
+def forecast_key(lat, lon):
+    """Snap coordinates to the forecast grid so nearby devices share a cache entry"""
+    lat = round(round(float(lat) / FORECAST_GRID) * FORECAST_GRID, 4)
+    lon = round(round(float(lon) / FORECAST_GRID) * FORECAST_GRID, 4)
+    return lat, lon
+
+def transform_forecast(weather_data):
+    # extract weather informations
+    to_be_pack = []
+    for day in weather_data['forecastDays']:
+        transformed_day = {
+            "year": day["displayDate"]["year"],
+            "month": day["displayDate"]["month"],
+            "day": day["displayDate"]["day"],
+            "temperature_max": day["maxTemperature"]["degrees"],
+            "temperature_min": day["minTemperature"]["degrees"],
+            "precipitation": 
+                day["daytimeForecast"]["precipitation"]["probability"]["percent"],
+            "weather_type": 
+                weather_image_mapping[day["daytimeForecast"]["weatherCondition"]["type"]],
+            "descriptions": 
+                day["daytimeForecast"]["weatherCondition"]["description"]["text"]
+        }
+        to_be_pack.append(transformed_day)
+    return to_be_pack
+
+def fetch_forecast(key):
+    lat, lon = key
+    logger.debug("Requesting weather for %s from: %s", key, upstreams['weather'].base_url)
+    
+    with STAGE_LATENCY.labels(stage="forecast_fetch").time():
+        weather_response = upstreams['weather'].get("/v1/forecast/days:lookup", params={
+            "key": GOOGLE_WEATHER_API_KEY,
+            "location.latitude": lat,
+            "location.longitude": lon,
+            "days": 5,
+        })
+    logger.debug("Weather API response status: %s", weather_response.status_code)
+    
+    weather_data = weather_response.json()
+    logger.debug("Weather API response: %s", weather_data)
+    
+    if 'forecastDays' not in weather_data:
+        raise ForecastUnavailable(weather_data)
+    
+    with STAGE_LATENCY.labels(stage="transform").time():
+        return transform_forecast(weather_data)
+
+def forecast_freshness(key):
+    """Seconds until the cached forecast for a grid cell is due for a refresh"""
+    age = forecast_cache.age(key)
+    return 0 if age is None else FORECAST_SOFT_TTL - age
+
+def get_forecast(lat, lon):
+    """Return the transformed 5-day forecast for the grid cell containing lat/lon, and
+    whether it is an outdated copy served because the weather API is failing"""
+    key = forecast_key(lat, lon)
+    try:
+        return forecast_cache.get_or_load(
+            key, lambda: forecast_flight.do(key, lambda: fetch_forecast(key))), False
+    except (UpstreamError, TimeoutError) as e:
+        to_be_pack = forecast_cache.get(key, max_age=FORECAST_STALE_IF_ERROR)
+        if to_be_pack is None:
+            raise
+        logger.warning(f"Weather API failing ({e}), serving cached forecast for {key}")
+        return to_be_pack, True
+    finally:
+        # registered once the entry is loaded, so the first prefetch is scheduled
+        # from its age rather than within the stagger window
+        if prefetcher is not None:
+            prefetcher.register(key)
+
+def prefetch_forecast(key):
+    """Fetch a grid cell's forecast ahead of time and store it in the cache"""
+    to_be_pack = forecast_flight.do(key, lambda: fetch_forecast(key))
+    forecast_cache.set(key, to_be_pack)
+    return to_be_pack
+
+def weather_topic(key):
+    return f"{WEATHER_TOPIC_PREFIX}/{key[0]:g}_{key[1]:g}"
+
+def publish_forecast(key, to_be_pack):
+    """Push a forecast to the devices in a grid cell as a retained message"""
+    payload = {
+        "latitude": key[0],
+        "longitude": key[1],
+        "updated": int(time.time()),
+        "forecast": to_be_pack,
+    }
+    weather_publisher.publish(weather_topic(key), json.dumps(payload), qos=1, retain=True)
+
+if WEATHER_MQTT_BROKER:
+    # paho-mqtt is only needed when publishing is enabled
+    from mqtt_publisher import MqttPublisher
+    weather_publisher = MqttPublisher(WEATHER_MQTT_BROKER, WEATHER_MQTT_PORT,
+                                      WEATHER_MQTT_USER, WEATHER_MQTT_PASS)
+else:
+    weather_publisher = None
+
+if FORECAST_PREFETCH:
+    prefetcher = ForecastPrefetcher(
+        prefetch_forecast, publish=publish_forecast if weather_publisher else None,
+        interval=FORECAST_SOFT_TTL, lead_time=FORECAST_PREFETCH_LEAD_TIME,
+        stagger=FORECAST_PREFETCH_STAGGER, idle_timeout=FORECAST_PREFETCH_IDLE_TIMEOUT,
+        age=forecast_cache.age, store=persistent_store,
+        lock_path=PERSISTENT_CACHE_PATH + '.prefetch.lock' if persistent_store else None)
+    prefetcher.start()
+else:
+    prefetcher = None
+
+def build_time(now):
+    """Return the /time payload for `now` with its CalendarDay and solar term"""
+    day = lunar_calendar.day(now.date())
+    
+    # index of the current solar term, the name is stored on the device
+    current_term = lunar_calendar.solar_term_at(day, now.timestamp())
+    
+    payload = {
+        "gregorian": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "weekday": day.weekday,
+        "solar": {
+            "year": day.year,
+            "month": day.month,
+            "day": day.day,
+            "solar_term": current_term
+        },
+        "lunar": {
+            "year": day.lunar_year,
+            "month": day.lunar_month,
+            "day": day.lunar_day,
+            "zodiac": day.zodiac
+        }
+    }
+    return payload, day, current_term
+
+def build_weather(ip):
+    """Return the /weather payload for a client IP, the forecast grid key it used and
+    whether the forecast is a stale-if-error copy"""
+    geo_data = lookup_location(ip)
+    
+    if not has_location(geo_data):
+        raise LocationUnavailable(ip, geo_data)
+    
+    lat = geo_data['latitude']
+    lon = geo_data['longitude']
+    logger.debug("Using coordinates: Latitude=%s, Longitude=%s", lat, lon)
+    
+    forecast, stale = get_forecast(lat, lon)
+    to_be_send = {
+        "location": geo_data["city"],
+        "district": geo_data["district"],
+        "forecast": forecast
+    }
+    key = forecast_key(lat, lon)
+    if weather_publisher is not None:
+        # devices can subscribe here instead of polling
+        to_be_send["topic"] = weather_topic(key)
+    return to_be_send, key, stale
+
+def cached_weather(ip):
+    """Last known /weather payload for a client IP without calling any upstream, or None"""
+    geo_data = geo_cache.get_stale(ip)
+    if geo_data is None or not has_location(geo_data):
+        return None
+    key = forecast_key(geo_data['latitude'], geo_data['longitude'])
+    to_be_pack = forecast_cache.get(key, max_age=FORECAST_STALE_IF_ERROR)
+    if to_be_pack is None:
+        return None
+    return {
+        "location": geo_data["city"],
+        "district": geo_data["district"],
+        "forecast": to_be_pack
+    }
+
 @app.route('/time')
 def get_lunar_time():
     try:
         now = datetime.now()
-        solar_date = Solar(now.year, now.month, now.day)
-        weekday = now.strftime("%A")
+        payload, day, current_term = build_time(now)
         
-        lunar_date = Converter.Solar2Lunar(solar_date)
+        if wants_binary():
+            return binary_response(compact_format.encode_time(now, day, current_term))
         
-        zodiac_en = ["Rat", "Ox", "Tiger", "Rabbit", "Dragon", "Snake",
-                    "Horse", "Goat", "Monkey", "Rooster", "Dog", "Pig"]
-        zodiac = zodiac_en[(lunar_date.year - 4) % 12]
-        
-        # calculate current solar term
-        # calculate the current solar term based on the current date and time
-        current_term = None
-        for i in range(len(solar_terms_2025)):
-            term = solar_terms_2025[i]
-            term_start = datetime.strptime(f"{term['date']} {term['time']}", "%Y-%m-%d %H:%M")
-            
-            # calculate the end time of the current solar term
-            if i < len(solar_terms_2025)-1:
-                next_term = solar_terms_2025[i+1]
-                term_end = datetime.strptime(f"{next_term['date']} {next_term['time']}", "%Y-%m-%d %H:%M")
-            else:
-                term_end = datetime(term_start.year+1, 1, 1)
-            
-            if term_start <= now < term_end:
-                current_term = i # the name of the current solar term will be stored at local
-                break
-        
-        return jsonify({
-            "gregorian": now.strftime("%Y-%m-%d %H:%M:%S"),
-            "weekday": weekday,
-            "solar": {
-                "year": solar_date.year,
-                "month": solar_date.month,
-                "day": solar_date.day,
-                "solar_term": current_term if current_term else 0
-            },
-            "lunar": {
-                "year": lunar_date.year,
-                "month": lunar_date.month,
-                "day": lunar_date.day,
-                "zodiac": zodiac
-            }
-        })
+        return jsonify(payload)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def generate_calendar(start, days, key):
+    # stream the rows as they are produced and keep the full body for the next device
+    chunks = []
+    def generate():
+        header = json.dumps({
+            "from": start.isoformat(),
+            "days": days,
+            "fields": CALENDAR_FIELDS,
+            "zodiac": ZODIAC_EN,
+        }, separators=(',', ':'))
+        chunk = header[:-1] + ',"data":['
+        chunks.append(chunk)
+        yield chunk
+        for i, entry in enumerate(lunar_calendar.days(start, days)):
+            chunk = ('' if i == 0 else ',') + json.dumps(calendar_row(entry), separators=(',', ':'))
+            chunks.append(chunk)
+            yield chunk
+        chunks.append(']}')
+        yield ']}'
+        calendar_cache.set(key, ''.join(chunks))
+    return generate()
+
+@app.route('/calendar', methods=['GET'])
+def get_calendar():
+    try:
+        start_arg = request.args.get('from')
+        # parsed by hand: type=int would fall back to the default on bad input
+        days_arg = request.args.get('days')
+        days = int(days_arg) if days_arg is not None else CALENDAR_DEFAULT_DAYS
+        start = datetime.strptime(start_arg, "%Y-%m-%d").date() if start_arg else datetime.now().date()
+    except ValueError:
+        return jsonify({"error": "Expected from=YYYY-MM-DD and an integer days"}), 400
+    
+    if not 1 <= days <= CALENDAR_MAX_DAYS:
+        return jsonify({"error": f"days must be between 1 and {CALENDAR_MAX_DAYS}"}), 400
+    
+    # a range always renders the same rows, so the ETag is known without building the body
+    etag = f"cal{CALENDAR_VERSION}-{start:%Y%m%d}-{days}"
+    if request.if_none_match.contains(etag):
+        return with_cache_headers(Response(status=304), CALENDAR_CACHE_TTL, etag)
+    
+    try:
+        key = (start, days)
+        body = calendar_cache.get(key)
+        if body is not None:
+            return with_cache_headers(Response(body, mimetype='application/json'), CALENDAR_CACHE_TTL, etag)
+        # fail before streaming starts if the range is outside what the converter supports
+        lunar_calendar.day(start)
+        lunar_calendar.day(start + timedelta(days=days - 1))
+    except ValueError as e:
+        return jsonify({"error": f"Date out of supported range: {e}"}), 400
+    
+    try:
+        response = Response(generate_calendar(start, days, key), mimetype='application/json')
+        return with_cache_headers(response, CALENDAR_CACHE_TTL, etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -165,85 +570,186 @@ def get_lunar_time():
 @app.route('/weather', methods=['GET'])
 def get_weather():
     try:
-        start_time = datetime.now()
-        log_request_details()
-        
         ip = get_client_ip()
-        logger.info(f"Client IP address: {ip}")
-        
-        url_ip = f"https://api.ipgeolocation.io/ipgeo?apiKey={IPGEO_API_KEY}&ip={ip}"
-        logger.info(f"Requesting location from: {url_ip}")
-        
-        geo_response = requests.get(url_ip)
-        logger.info(f"Location API response status: {geo_response.status_code}")
         
-        geo_data = geo_response.json()
-        logger.debug(f"Location API response: {geo_data}")
+        to_be_send, key, _ = build_weather(ip)
         
-        if not all(key in geo_data for key in ['latitude', 'longitude']):
-            logger.error("Location API response missing latitude/longitude")
-            logger.error(f"Full response: {geo_data}")
-            return jsonify({
-                "error": "Unable to retrieve location",
-                "ip": ip,
-                "geo_data": geo_data
-            }), 400
-        
-        lat = geo_data['latitude']
-        lon = geo_data['longitude']
-        logger.info(f"Using coordinates: Latitude={lat}, Longitude={lon}")
-        
-        url_weather = f"https://weather.googleapis.com/v1/forecast/days:lookup?key={GOOGLE_WEATHER_API_KEY}&location.latitude={lat}&location.longitude={lon}&days=5"
-        logger.info(f"Requesting weather from: {url_weather}")
-        
-        weather_response = requests.get(url_weather)
-        logger.info(f"Weather API response status: {weather_response.status_code}")
-        
-        weather_data = weather_response.json()
-        logger.debug(f"Weather API response: {weather_data}")
-        
-        if 'forecastDays' not in weather_data:
-            logger.error("Weather API response missing 'forecastDays'")
-            logger.error(f"Response keys: {weather_data.keys()}")
-            return jsonify({
-                "error": "Unable to retrieve weather data",
-                "weather_response": weather_data
-            }), 400
-        
-        # extract weather informations
-        to_be_pack = []
-        for day in weather_data['forecastDays']:
-            transformed_day = {
-                "year": day["displayDate"]["year"],
-                "month": day["displayDate"]["month"],
-                "day": day["displayDate"]["day"],
-                "temperature_max": day["maxTemperature"]["degrees"],
-                "temperature_min": day["minTemperature"]["degrees"],
-                "precipitation": 
-                    day["daytimeForecast"]["precipitation"]["probability"]["percent"],
-                "weather_type": 
-                    weather_image_mapping[day["daytimeForecast"]["weatherCondition"]["type"]],
-                "descriptions": 
-                    day["daytimeForecast"]["weatherCondition"]["description"]["text"]
-            }
-            to_be_pack.append(transformed_day)
+        with STAGE_LATENCY.labels(stage="serialization").time():
+            if wants_binary():
+                response = binary_response(compact_format.encode_weather(to_be_send))
+            else:
+                response = jsonify(to_be_send)
+        return with_cache_headers(response, forecast_freshness(key))
+    
+    except LocationUnavailable as e:
+        logger.error("Location API response missing latitude/longitude")
+        logger.error(f"Full response: {e.geo_data}")
+        return jsonify({
+            "error": "Unable to retrieve location",
+            "ip": e.ip,
+            "geo_data": e.geo_data
+        }), 400
+    
+    except ForecastUnavailable as e:
+        logger.error("Weather API response missing 'forecastDays'")
+        logger.error(f"Response keys: {e.weather_data.keys()}")
+        return jsonify({
+            "error": "Unable to retrieve weather data",
+            "weather_response": e.weather_data
+        }), 400
+    
+    except UpstreamError as e:
+        logger.error(f"Upstream unavailable: {e}")
+        return jsonify({"error": str(e)}), 502
+    
+    except TimeoutError as e:
+        logger.error(f"Timed out waiting for upstream: {e}")
+        return jsonify({"error": str(e)}), 504
+    
+    except Exception as e:
+        logger.exception(f"Unexpected error in /weather endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def collect_cache_metrics():
+    """Cache, coalescing and logging counters, read at scrape time"""
+    caches = {
+        "geo": geo_cache.stats(),
+        "forecast": forecast_cache.stats(),
+        "calendar": calendar_cache.stats(),
+        "lunar": lunar_calendar.stats(),
+    }
+    flights = {"geo": geo_flight.stats(), "forecast": forecast_flight.stats()}
+    return [
+        ("timeserver_cache_hits_total", "counter", "Cache hits (including stale hits)",
+         [({"cache": name}, st["hits"] + st.get("stale_hits", 0)) for name, st in caches.items()]),
+        ("timeserver_cache_misses_total", "counter", "Cache misses",
+         [({"cache": name}, st["misses"]) for name, st in caches.items()]),
+        ("timeserver_cache_hit_ratio", "gauge", "Cache hit ratio since start",
+         [({"cache": name}, st["hit_ratio"]) for name, st in caches.items()]),
+        ("timeserver_cache_entries", "gauge", "Entries currently cached",
+         [({"cache": name}, st["size"]) for name, st in caches.items()]),
+        ("timeserver_upstream_coalesced_total", "counter", "Requests that joined an in-flight upstream call",
+         [({"upstream": name}, st["coalesced"]) for name, st in flights.items()]),
+        ("timeserver_upstream_in_flight", "gauge", "Upstream calls currently in flight",
+         [({"upstream": name}, st["in_flight"]) for name, st in flights.items()]),
+        ("timeserver_upstream_circuit_open", "gauge", "1 while the upstream circuit breaker is not closed",
+         [({"upstream": name}, int(client.breaker.state != client.breaker.CLOSED))
+          for name, client in upstreams.items()]),
+        ("timeserver_log_records_dropped_total", "counter", "Log records dropped because the queue was full",
+         [({}, log_handler.dropped)]),
+    ] + collect_store_metrics()
+
+def collect_store_metrics():
+    if persistent_store is None:
+        return []
+    st = persistent_store.stats()
+    return [
+        ("timeserver_persistent_cache_reads_total", "counter", "Lookups that reached the persistent cache",
+         [({"result": "hit"}, st["read_hits"]), ({"result": "miss"}, st["reads"] - st["read_hits"])]),
+        ("timeserver_persistent_cache_writes_total", "counter", "Entries committed to the persistent cache",
+         [({}, st["writes"])]),
+        ("timeserver_persistent_cache_dropped_total", "counter", "Writes dropped because the queue was full",
+         [({}, st["dropped"])]),
+        ("timeserver_persistent_cache_queued", "gauge", "Writes waiting for the next commit",
+         [({}, st["queued"])]),
+    ]
+
+def collect_prefetch_metrics():
+    if prefetcher is None:
+        return []
+    st = prefetcher.stats()
+    return [
+        ("timeserver_prefetch_locations", "gauge", "Grid cells the forecast prefetcher keeps fresh",
+         [({}, st["locations"])]),
+        ("timeserver_prefetch_refreshes_total", "counter", "Forecast prefetches",
+         [({"result": "ok"}, st["refreshes"]), ({"result": "error"}, st["refresh_errors"])]),
+        ("timeserver_prefetch_publishes_total", "counter", "Prefetched forecasts published over MQTT",
+         [({"result": "ok"}, st["publishes"]), ({"result": "error"}, st["publish_errors"])]),
+    ]
+
+REGISTRY.add_collector(collect_cache_metrics)
+REGISTRY.add_collector(collect_prefetch_metrics)
+
+# counters of workers that have exited, so merged counters never go down
+ARCHIVED_METRICS = "archived"
+metrics_lock = threading.Lock()
+metrics_archived = False
+
+def share_metrics():
+    """Publish this process's metrics so any worker can answer /metrics for all of them"""
+    while True:
+        time.sleep(METRICS_SHARE_INTERVAL)
+        with metrics_lock:
+            if metrics_archived:
+                return
+            persistent_store.put("metrics", str(os.getpid()), REGISTRY.collect(), ttl=3 * METRICS_SHARE_INTERVAL)
+
+def archive_metrics():
+    """Fold this worker's final counters into the archived row and drop its live one; called on worker exit"""
+    global metrics_archived
+    with metrics_lock:
+        metrics_archived = True
+    # gauges describe a live process and die with it
+    final = [family for family in REGISTRY.collect() if family[1] != "gauge"]
+    persistent_store.update(
+        "metrics", ARCHIVED_METRICS,
+        lambda archived: merge_families([(ARCHIVED_METRICS, archived or []), (ARCHIVED_METRICS, final)]),
+        delete=[str(os.getpid())])
+
+if persistent_store is not None:
+    threading.Thread(target=share_metrics, name="share-metrics", daemon=True).start()
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    families = REGISTRY.collect()
+    if persistent_store is not None:
+        # counters are summed over the live workers and the archived ones, gauges get a worker label
+        pid = str(os.getpid())
+        others = [(worker, snapshot) for worker, snapshot, _ in persistent_store.load("metrics") if worker != pid]
+        families = merge_families([(pid, families)] + others)
+    return Response(REGISTRY.render(families), mimetype='text/plain; version=0.0.4')
+
+@app.route('/snapshot', methods=['GET'])
+def get_snapshot():
+    try:
+        ip = get_client_ip()
         
-        to_be_send = {
-            "location": geo_data["city"],
-            "district": geo_data["district"],
-            "forecast": to_be_pack
-        }
+        # the weather part may wait on upstreams, so it runs while the time part is built
+        weather_future = submit_snapshot_weather(ip)
+        now = datetime.now()
+        time_payload, day, current_term = build_time(now)
         
-        # record processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"Request processed in {processing_time:.3f} seconds")
+        weather, stale, weather_error = None, False, None
+        try:
+            if weather_future is None:
+                raise RuntimeError("too many weather lookups pending")
+            weather, _, stale = weather_future.result(timeout=SNAPSHOT_WEATHER_TIMEOUT)
+        except Exception as e:
+            # slow or failing upstream: fall back to whatever is cached, the
+            # background call keeps running and refreshes the cache for next time
+            weather_error = str(e) or type(e).__name__
+            weather = cached_weather(ip)
+            stale = weather is not None
+            logger.warning(f"Snapshot weather for {ip} unavailable ({weather_error}), "
+                           f"{'serving cached copy' if stale else 'no cached copy'}")
         
-        return jsonify(to_be_send)
+        with STAGE_LATENCY.labels(stage="serialization").time():
+            if wants_binary():
+                time_record = compact_format.encode_time(now, day, current_term)
+                weather_record = compact_format.encode_weather(weather) if weather else None
+                return binary_response(compact_format.encode_snapshot(time_record, weather_record, stale))
+            
+            payload = {"time": time_payload, "weather": weather, "weather_stale": stale}
+            if weather is None:
+                payload["weather_error"] = weather_error
+            return jsonify(payload)
     
     except Exception as e:
-        logger.exception(f"Unexpected error in /weather endpoint: {str(e)}")
+        logger.exception(f"Unexpected error in /snapshot endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# development server; for production run several workers with
+#   gunicorn -c gunicorn.conf.py time_server:app
 if __name__ == '__main__':
     logger.info("Starting weather API server")
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
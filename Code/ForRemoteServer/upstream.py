@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """An upstream API could not be reached or answered with a server error"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The upstream is failing and calls are short-circuited until it recovers"""
+
+
+class CircuitBreaker:
+    """Open after failure_threshold consecutive failures, let one trial call
+    through after reset_timeout, close again on the first success"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # a single trial request decides whether the circuit closes again
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client for one upstream host with timeouts, bounded
+    retries with exponential backoff and a circuit breaker"""
+
+    def __init__(self, name, base_url, connect_timeout=3.0, read_timeout=10.0,
+                 retries=2, backoff_factor=0.5, pool_size=10,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount(self.base_url, adapter)
+
+    def get(self, path, params=None):
+        """GET base_url + path; raises UpstreamError on network or 5xx failures"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        try:
+            response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f"{self.name} request failed: {e}") from e
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise UpstreamError(f"{self.name} returned HTTP {response.status_code}")
+
+        # 4xx answers (bad key, unknown IP) come from a healthy upstream
+        self.breaker.record_success()
+        return response
+
+    def worst_case_time(self):
+        """Longest a get() can take: every attempt timing out plus the backoff between them"""
+        attempts = self.retries + 1
+        backoff = sum(self.backoff_factor * 2 ** n for n in range(self.retries))
+        return attempts * sum(self.timeout) + backoff
+
+    def close(self):
+        self.session.close()
+
+
+def build_clients(config):
+    """Create one UpstreamClient per entry of a {name: {option: value}} config dict"""
+    return {name: UpstreamClient(name, **options) for name, options in config.items()}